@@ -0,0 +1,154 @@
+from array import array
+from mmap import ACCESS_READ, mmap
+from os import fstat, getpid, path, remove, replace, stat, stat_result
+from struct import Struct
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from splitter import split_test_cases, test_case_index
+
+# bump when the archive layout changes
+ARCHIVE_FORMAT = 1
+MAGIC = b"HSKA%04d" % ARCHIVE_FORMAT
+# magic, test case count
+HEADER = Struct("<8sq")
+OFFSET_SIZE = 8
+
+# a raw test case: path of its splitter.py raw/ file, or path of an archive & index of the test case in it
+RawSource = Union[str, Tuple[str, int]]
+
+
+def pack(src: Iterable[str], archive_path: str) -> int:
+    """pack a test suite into an indexed archive in a single scan, returning its test case count
+
+    The archive is the header, an index of count + 1 byte offsets, then the test cases, each stored as splitter.py
+    writes its raw/ file (so that both share cache entries). The declared test suite size is read first: the index
+    is reserved up front and filled in as test cases are split, so a suite with extra test cases fails as soon as one
+    is read and a truncated suite at its end, before the archive is renamed into place.
+    """
+    src = iter(src)
+    count = int(next(src))
+    offsets = array("q")
+    assert offsets.itemsize == OFFSET_SIZE, "unsupported offset size"
+    offset = HEADER.size + OFFSET_SIZE * (count + 1)
+    tmp_path = "%s.%d.tmp" % (archive_path, getpid())
+    try:
+        with open(tmp_path, "wb") as dst:
+            dst.seek(offset)
+            for test_case in split_test_cases(src):
+                assert len(offsets) < count, "more test cases than the %d declared" % count
+                offsets.append(offset)
+                offset += dst.write(("\n".join(test_case) + "\n").encode())
+            assert len(offsets) == count, "incomplete source file, %d test cases out of %d" % (len(offsets), count)
+            offsets.append(offset)
+            dst.seek(0)
+            dst.write(HEADER.pack(MAGIC, count))
+            dst.write(offsets.tobytes())
+    except BaseException:
+        if path.exists(tmp_path):
+            remove(tmp_path)
+        raise
+    replace(tmp_path, archive_path)
+    return count
+
+
+class Archive:
+    """Memory mapped test suite archive: test case k is sliced straight out of the map through the index"""
+    archive_path: str
+    count: int
+    identity: Tuple[int, int, int, int]
+    _map: mmap
+    _offsets: array
+
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+        with open(archive_path, "rb") as f:
+            st = fstat(f.fileno())
+            assert st.st_size >= HEADER.size, "truncated archive %s" % archive_path
+            self.identity = file_identity(st)
+            self._map = mmap(f.fileno(), 0, access=ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._map)
+        assert magic == MAGIC, "%s is not an archive of format %d" % (archive_path, ARCHIVE_FORMAT)
+        self._offsets = array("q", self._map[HEADER.size:HEADER.size + OFFSET_SIZE * (self.count + 1)])
+        assert len(self._offsets) == self.count + 1 and self._offsets[-1] == len(self._map), \
+            "truncated archive %s" % archive_path
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, idx: int) -> bytes:
+        """raw content of the idx-th (0-based) test case"""
+        if not 0 <= idx < self.count:
+            raise IndexError("test case %d out of the %d of %s" % (idx, self.count, self.archive_path))
+        return self._map[self._offsets[idx]:self._offsets[idx + 1]]
+
+    def lines(self, idx: int) -> List[str]:
+        """stripped lines of the idx-th test case"""
+        return self[idx].decode().split("\n")[:-1]
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "Archive":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def file_identity(st: stat_result) -> Tuple[int, int, int, int]:
+    """device, inode, modification time & size of a file, which change when it is re-packed or replaced"""
+    return st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size
+
+
+# archives opened by this process, so that pool workers map each archive once
+_archives: Dict[str, Archive] = {}
+
+
+def open_archive(archive_path: str) -> Archive:
+    """archive mapped by this process, mapped again if the file changed since (a long-lived process such as
+    translator_daemon.py outlives the archives it maps)"""
+    archive = _archives.get(archive_path)
+    if archive is not None and archive.identity != file_identity(stat(archive_path)):
+        archive.close()
+        archive = None
+    if archive is None:
+        archive = _archives[archive_path] = Archive(archive_path)
+    return archive
+
+
+def read_raw(src: RawSource) -> Optional[bytes]:
+    """raw content of a test case, None if it does not exist"""
+    if isinstance(src, tuple):
+        archive_path, idx = src
+        archive = open_archive(archive_path)
+        return archive[idx] if idx < len(archive) else None
+    try:
+        with open(src, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def parse_range(spec: Optional[str], count: int) -> range:
+    """test case indices selected by a START:STOP range (0-based, STOP excluded, either end optional)"""
+    if spec is None:
+        return range(count)
+    start, sep, stop = spec.partition(":")
+    assert sep, "test case range should be START:STOP, not %s" % spec
+    res = range(count)[slice(int(start) if start else None, int(stop) if stop else None)]
+    assert res, "empty test case range %s out of %d test cases" % (spec, count)
+    return res
+
+
+def select_range(names: Iterable[str], spec: Optional[str]) -> List[str]:
+    """test cases of a directory (splitter.py raw/, feed or oracle) in test case order, only those whose index lies in
+    a START:STOP range if given
+
+    Indices are those of the test case names, not positions in the directory, so that a range selects the same test
+    cases in every mode. The range is relative to the suite size the last test case implies.
+    """
+    names = sorted(names, key=test_case_index)
+    if spec is None:
+        return names
+    indices = parse_range(spec, test_case_index(names[-1]) + 1 if names else 0)
+    return [name for name in names if test_case_index(name) in indices]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+
+import json
+from argparse import ArgumentParser
+from gc import collect
+from platform import platform, python_version
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+from typing import Callable, Dict, List
+
+from cache import translator_version
+from compare import diff_msgs, preprocess_msgs
+from gen_trace import generate_suite
+from haskell2mmtp import parse_lines
+from splitter import split_test_cases
+from translator import ORACLE, OrderRq, Trade, Translator
+
+
+def measure(stage: Callable[[], object], items: int) -> Dict[str, float]:
+    """time a benchmark stage, then run it again under tracemalloc for its peak memory"""
+    collect()
+    begin = perf_counter()
+    stage()
+    seconds = perf_counter() - begin
+
+    collect()
+    start()
+    stage()
+    _, peak = get_traced_memory()
+    stop()
+    return {
+        "seconds": seconds,
+        "items": items,
+        "items_per_second": items / seconds if seconds else None,
+        "peak_memory_bytes": peak,
+    }
+
+
+def encode_all(orders: List[OrderRq]) -> None:
+    translator = Translator()
+    for rq in orders:
+        translator.update_order_book_view_by_order(rq, False)
+        trade = Trade(rq.price, 0, rq.id, rq.id)
+        translator.translate_order(rq)
+        translator.translate_confirmation_msg(rq)
+        translator.translate_execution_notice(trade, rq)
+        translator.translate_rejection_msg(rq)
+
+
+def bench(suite: List[str]) -> Dict[str, Dict[str, float]]:
+    res = {}
+    test_cases = list(split_test_cases(iter(suite[1:])))
+    res["split"] = measure(lambda: list(split_test_cases(iter(suite[1:]))), len(test_cases))
+
+    lines = sum(len(test_case) for test_case in test_cases)
+    res["preprocess"] = measure(lambda: [list(parse_lines(test_case[1:])) for test_case in test_cases], lines)
+
+    traces = [(int(test_case[0]), list(parse_lines(test_case[1:]))) for test_case in test_cases]
+    requests = sum(request_count for request_count, _ in traces)
+    res["translate"] = measure(
+        lambda: [Translator().translate(request_count, records) for request_count, records in traces], requests)
+
+    orders = [
+        OrderRq(*rq) for request_count, records in traces for rq in records[:request_count] if rq[0] == "NewOrderRq"
+    ]
+    for idx, rq in enumerate(orders):
+        rq.id = idx
+    res["encode"] = measure(lambda: encode_all(orders), 4 * len(orders))
+
+    oracles = [
+        [line for channel, line in Translator().translate_iter(request_count, records) if channel == ORACLE]
+        for request_count, records in traces
+    ]
+    records = sum(map(len, oracles))
+    res["compare"] = measure(
+        lambda: [diff_msgs("bench", preprocess_msgs(oracle), preprocess_msgs(oracle)) for oracle in oracles], records)
+    return res
+
+
+def main():
+    parser = ArgumentParser(usage="\t%(prog)s [options]")
+    parser.add_argument("--test-cases", type=int, default=20, help="generated test cases (default: %(default)s)")
+    parser.add_argument("--requests", type=int, default=1000, help="order requests per trace (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=20, help="queued orders in the book (default: %(default)s)")
+    parser.add_argument("--fanout", type=int, default=2, help="trades per aggressive order (default: %(default)s)")
+    parser.add_argument("--cancel", type=float, default=0.1, help="ratio of cancel requests (default: %(default)s)")
+    parser.add_argument("--replace", type=float, default=0.1, help="ratio of replace requests (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    params = dict(depth=args.depth, fanout=args.fanout, cancel_ratio=args.cancel, replace_ratio=args.replace)
+    suite = generate_suite(args.test_cases, args.requests, args.seed, **params)
+    report = {
+        "translator_version": translator_version(),
+        "python": python_version(),
+        "platform": platform(),
+        "params": dict(test_cases=args.test_cases, requests=args.requests, seed=args.seed, **params),
+        "results": bench(suite),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
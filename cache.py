@@ -0,0 +1,125 @@
+import json
+from hashlib import sha256
+from os import makedirs, path, remove, replace, scandir, utime, getpid
+from typing import Dict
+
+from translator import Translator
+
+# bump when the layout of the cache entries changes
+CACHE_FORMAT = 1
+# modules on the translation path, whose source determines the translated output: test case splitting, parsing (parsed
+# trace records included) & translation
+SOURCES = ["splitter.py", "haskell2mmtp.py", "parsed_trace.py", "translator.py", "layouts.py"]
+DEFAULT_MAX_SIZE = 1 << 30
+
+
+def translator_version() -> str:
+    """version stamp of the translator: a hash of the cache format & of the translator sources"""
+    digest = sha256(b"%d" % CACHE_FORMAT)
+    for name in SOURCES:
+        with open(path.join(path.dirname(path.abspath(__file__)), name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def translator_config(translator: Translator) -> Dict[str, object]:
+    """configuration of a translator that affects its output, or whether it is validated"""
+    return {
+        "security_id": translator.security_id,
+        "cisin": translator.cisin,
+        "group": translator.group,
+        "date": translator.date,
+        "time": translator.time,
+        "reference_price": translator.reference_price,
+        "lower_bound_percentage": translator.lower_bound_percentage,
+        "upper_bound_percentage": translator.upper_bound_percentage,
+        "max_tombstones": translator.max_tombstones if translator.bounded_memory else None,
+        "compact_feed": translator.compact_feed,
+        "check_every": translator.check_every,
+        "multi_security": translator.multi_security,
+    }
+
+
+class TranslationCache:
+    """Content addressed on-disk cache of translated test cases
+
+    Entries are keyed by the hash of the raw test case, of the translator configuration and of the translator version,
+    and hold the feed & oracle outputs. Hits refresh the entry modification time, so that `evict` drops the least
+    recently used entries once the cache grows over `max_size` bytes.
+    Several processes may share a cache directory: entries are written atomically.
+    """
+    cache_dir: str
+    max_size: int
+    prefix: bytes
+    hits: int
+    misses: int
+    evicted: int
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_MAX_SIZE, config: Dict[str, object] = None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if config is None:
+            config = translator_config(Translator())
+        self.prefix = json.dumps([translator_version(), config], sort_keys=True).encode() + b"\n"
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        makedirs(cache_dir, exist_ok=True)
+
+    def key(self, content: bytes) -> str:
+        return sha256(self.prefix + content).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return path.join(self.cache_dir, key)
+
+    def get(self, key: str, feed_path: str, oracle_path: str) -> bool:
+        """write the cached outputs of `key` to feed_path & oracle_path, returning whether it was a hit"""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as f:
+                feed_size = int(f.readline())
+                feed = f.read(feed_size)
+                oracle = f.read()
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return False
+        with open(feed_path, "wb") as f:
+            f.write(feed)
+        with open(oracle_path, "wb") as f:
+            f.write(oracle)
+        utime(entry_path)
+        self.hits += 1
+        return True
+
+    def put(self, key: str, feed_path: str, oracle_path: str) -> None:
+        """store the translated outputs of `key`"""
+        with open(feed_path, "rb") as f:
+            feed = f.read()
+        with open(oracle_path, "rb") as f:
+            oracle = f.read()
+        tmp_path = "%s.%d.tmp" % (self._entry_path(key), getpid())
+        with open(tmp_path, "wb") as f:
+            f.write(b"%d\n" % len(feed))
+            f.write(feed)
+            f.write(oracle)
+        replace(tmp_path, self._entry_path(key))
+
+    def evict(self) -> None:
+        """drop the least recently used entries until the cache fits in max_size"""
+        entries = [entry for entry in scandir(self.cache_dir) if entry.is_file() and not entry.name.endswith(".tmp")]
+        entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry_path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                remove(entry_path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            self.evicted += 1
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        return "cache: %d hits, %d misses (%.1f%% hit rate), %d evicted" % (
+            self.hits, self.misses, 100.0 * self.hits / total if total else 0.0, self.evicted)
@@ -0,0 +1,39 @@
+import pickle
+from hashlib import sha256
+from os import SEEK_END, getpid, replace
+from typing import Dict
+
+# bump when the content of the checkpoints changes
+CHECKPOINT_FORMAT = 3
+# bytes hashed at each end of a trace by fingerprint
+FINGERPRINT_SPAN = 64 * 1024
+
+
+def save(checkpoint_path: str, checkpoint: Dict[str, object]) -> None:
+    """write a translation checkpoint atomically, so that a crash never leaves a torn one behind"""
+    tmp_path = "%s.%d.tmp" % (checkpoint_path, getpid())
+    with open(tmp_path, "wb") as f:
+        pickle.dump(dict(checkpoint, format=CHECKPOINT_FORMAT), f, protocol=pickle.HIGHEST_PROTOCOL)
+    replace(tmp_path, checkpoint_path)
+
+
+def load(checkpoint_path: str) -> Dict[str, object]:
+    with open(checkpoint_path, "rb") as f:
+        checkpoint = pickle.load(f)
+    assert checkpoint.get("format") == CHECKPOINT_FORMAT, \
+        "%s is not a checkpoint of format %d" % (checkpoint_path, CHECKPOINT_FORMAT)
+    return checkpoint
+
+
+def fingerprint(trace_path: str) -> Dict[str, object]:
+    """cheap identity of a trace: its size & a digest of its first & last FINGERPRINT_SPAN bytes
+
+    The request count & the first requests are in the head, the last responses in the tail, so an edited or
+    regenerated trace of the same size is told apart without hashing it all.
+    """
+    with open(trace_path, "rb") as f:
+        digest = sha256(f.read(FINGERPRINT_SPAN))
+        size = f.seek(0, SEEK_END)
+        f.seek(max(size - FINGERPRINT_SPAN, 0))
+        digest.update(f.read())
+    return {"size": size, "sha256": digest.hexdigest()}
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+
+import json
+from argparse import ArgumentParser
+from collections import deque
+from contextlib import ExitStack
+from difflib import unified_diff
+from itertools import zip_longest
+from multiprocessing import Pool
+from os import cpu_count, listdir, path
+from sys import stderr, stdout
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.etree.ElementTree import Element, ElementTree, SubElement
+
+from archive import RawSource, open_archive, parse_range, read_raw, select_range
+from haskell2mmtp import parse_lines
+from layouts import LAYOUTS, field_at, volatile_columns
+from splitter import test_case_name
+from translator import Translator
+
+
+# volatile columns (offset, width) of every compared SLE message, blanked before comparison
+MASKS: Dict[str, List[Tuple[int, int]]] = {
+    code: volatile_columns(LAYOUTS[code]) for code in ["0105", "0138", "0144", "0172"]
+}
+
+COLORS = {"-": "\033[31m", "+": "\033[34m", "@": "\033[35m"}
+
+
+def mask_record(record: str, masks: List[Tuple[int, int]]) -> str:
+    """blank the masked columns of a record, leaving records too short for a mask untouched like sed does"""
+    for offset, width in masks:
+        if len(record) >= offset + width:
+            record = record[:offset] + " " * width + record[offset + width:]
+    return record
+
+
+def preprocess_msgs(lines) -> Dict[str, List[str]]:
+    """route MMTP records by function code & mask their volatile columns, in a single pass"""
+    msgs = {code: [] for code in MASKS}
+    for line in lines:
+        line = line.rstrip("\n")
+        masks = MASKS.get(line[16:20])
+        if masks is not None:
+            msgs[line[16:20]].append(mask_record(line, masks) + "\n")
+    return msgs
+
+
+def read_msgs(mmtp_path: str, verbose: bool = True) -> Dict[str, List[str]]:
+    try:
+        with open(mmtp_path) as f:
+            return preprocess_msgs(f)
+    except FileNotFoundError:
+        if verbose:
+            print("%s: No such file or directory" % mmtp_path, file=stderr)
+        return preprocess_msgs([])
+
+
+def diff_test_case(name: str, oracle_path: str, actual_path: str) -> List[str]:
+    """unified diff of the masked oracle against the masked actual output of a test case"""
+    return diff_msgs(name, read_msgs(oracle_path), read_msgs(actual_path))
+
+
+def diff_msgs(name: str, oracle: Dict[str, List[str]], actual: Dict[str, List[str]]) -> List[str]:
+    res = []
+    for code in sorted(MASKS):
+        oracle_name = "res/%s/oracle/SLE-%s.mmtp" % (name, code)
+        actual_name = "res/%s/actual/SLE-%s.mmtp" % (name, code)
+        diff = list(unified_diff(oracle[code], actual[code], oracle_name, actual_name))
+        if diff:
+            res.append("diff -u %s %s\n" % (oracle_name, actual_name))
+            res += diff
+    return res
+
+
+def mismatch_report(code: str, record: int, oracle_record: Optional[str], actual_record: Optional[str]) -> \
+        Dict[str, object]:
+    """mismatch of the record-th masked records of an SLE message, with the name of the first differing field"""
+    field = None
+    if oracle_record is not None and actual_record is not None:
+        offset = next((i for i, (o, a) in enumerate(zip(oracle_record, actual_record)) if o != a),
+                      min(len(oracle_record), len(actual_record)))
+        field = field_at(LAYOUTS[code], offset)
+        field = field.name if field is not None else "offset %d" % offset
+    return {
+        "sle": code,
+        "record": record,
+        "field": field,
+        "oracle": oracle_record,
+        "actual": actual_record,
+    }
+
+
+def first_mismatch(oracle: Dict[str, List[str]], actual: Dict[str, List[str]]) -> Optional[Dict[str, object]]:
+    """first differing masked record of the first differing SLE message, with the name of the differing field"""
+    for code in sorted(MASKS):
+        oracle_msgs, actual_msgs = oracle[code], actual[code]
+        if oracle_msgs == actual_msgs:
+            continue
+        idx = next((i for i, (o, a) in enumerate(zip(oracle_msgs, actual_msgs)) if o != a),
+                   min(len(oracle_msgs), len(actual_msgs)))
+        oracle_record = oracle_msgs[idx].rstrip("\n") if idx < len(oracle_msgs) else None
+        actual_record = actual_msgs[idx].rstrip("\n") if idx < len(actual_msgs) else None
+        return mismatch_report(code, idx + 1, oracle_record, actual_record)
+    return None
+
+
+def stream_mismatches(oracle: Iterable[str], actual: Iterable[str], max_mismatches: int = 1) -> \
+        List[Dict[str, object]]:
+    """compare two MMTP outputs in lockstep, stopping after max_mismatches differing records (None for all)
+
+    Records are routed to a pair of queues per SLE message and compared as soon as both sides have one; a record is
+    only masked when it differs from its counterpart. The unmatched records left at the end are mismatches too.
+    """
+    pending = {code: (deque(), deque()) for code in MASKS}
+    compared = dict.fromkeys(MASKS, 0)
+    res = []
+    for oracle_line, actual_line in zip_longest(oracle, actual):
+        for side, line in enumerate((oracle_line, actual_line)):
+            if line is None:
+                continue
+            queues = pending.get(line[16:20])
+            if queues is None:
+                continue
+            queues[side].append(line.rstrip("\n"))
+            oracle_queue, actual_queue = queues
+            if not (oracle_queue and actual_queue):
+                continue
+            oracle_record, actual_record = oracle_queue.popleft(), actual_queue.popleft()
+            code = line[16:20]
+            compared[code] += 1
+            if oracle_record == actual_record:
+                continue
+            masks = MASKS[code]
+            oracle_record, actual_record = mask_record(oracle_record, masks), mask_record(actual_record, masks)
+            if oracle_record != actual_record:
+                res.append(mismatch_report(code, compared[code], oracle_record, actual_record))
+                if max_mismatches is not None and len(res) >= max_mismatches:
+                    return res
+
+    for code in sorted(MASKS):
+        masks = MASKS[code]
+        for idx, (oracle_record, actual_record) in enumerate(zip_longest(*pending[code]), compared[code] + 1):
+            res.append(mismatch_report(code, idx, oracle_record and mask_record(oracle_record, masks),
+                                       actual_record and mask_record(actual_record, masks)))
+            if max_mismatches is not None and len(res) >= max_mismatches:
+                return res
+    return res
+
+
+def request_of(test_case: List[str], code: str, record: int) -> Optional[Dict[str, object]]:
+    """haskell request whose translation emitted the record-th oracle record of an SLE message
+
+    The raw test case (stripped lines, as splitter.py writes them) is translated again until that record. Returns the
+    1-based request index, its line number & its type, None if no request emitted that record.
+    """
+    test_case = list(filter(None, test_case))
+    request_count = int(test_case[0])
+    records = list(parse_lines(test_case[1:], skip_unused=True))
+    requests = records[:request_count]
+    emitted = 0
+    translated = Translator().translate_requests(request_count, requests, records[request_count:])
+    for idx, (rq, (_, results)) in enumerate(zip(requests, translated), 1):
+        emitted += sum(line[16:20] == code for line in results if line)
+        if emitted >= record:
+            return {"index": idx, "line": idx + 1, "type": rq[0]}
+    return None
+
+
+def _mmtp_lines(stack: ExitStack, mmtp_path: str) -> Iterable[str]:
+    try:
+        return stack.enter_context(open(mmtp_path))
+    except FileNotFoundError:
+        return []
+
+
+def compare_test_case(job: Tuple[str, str, str, bool, Optional[int], Optional[RawSource]]) -> Dict[str, object]:
+    """pool worker: compare the oracle & actual outputs of a test case
+
+    With a diff, both outputs are compared whole; otherwise they are streamed and the comparison stops after
+    `max_mismatches` differing records. Given the raw haskell test case, the mismatches are traced back to the haskell
+    request that led to them, be it read from its raw/ file or from an archive.
+    Returns its report: status (pass, fail or missing), the first mismatch, every mismatch found and, if requested,
+    the unified diff.
+    """
+    name, oracle_path, actual_path, with_diff, max_mismatches, raw = job
+    missing = [mmtp_path for mmtp_path in (oracle_path, actual_path) if not path.exists(mmtp_path)]
+    diff = []
+    if with_diff:
+        oracle, actual = read_msgs(oracle_path, verbose=False), read_msgs(actual_path, verbose=False)
+        mismatch = first_mismatch(oracle, actual)
+        mismatches = [mismatch] if mismatch else []
+        diff = diff_msgs(name, oracle, actual) if mismatch else []
+    else:
+        with ExitStack() as stack:
+            mismatches = stream_mismatches(_mmtp_lines(stack, oracle_path), _mmtp_lines(stack, actual_path),
+                                           max_mismatches or 1)
+
+    content = read_raw(raw) if raw is not None and mismatches else None
+    if content is not None:
+        test_case = list(map(str.strip, content.decode().split("\n")))
+        for mismatch in mismatches:
+            try:
+                mismatch["request"] = request_of(test_case, mismatch["sle"], mismatch["record"])
+            except Exception:
+                mismatch["request"] = None
+    return {
+        "name": name,
+        "status": "missing" if missing else "fail" if mismatches else "pass",
+        "missing": missing,
+        "mismatch": mismatches[0] if mismatches else None,
+        "mismatches": mismatches,
+        "diff": diff,
+    }
+
+
+def compare_suite(names: List[str], oracle_dir: str, actual_dir: str, jobs: int = None, with_diff: bool = True,
+                  max_mismatches: int = None, raw_dir: str = None, archive_path: str = None) -> \
+        Iterator[Dict[str, object]]:
+    """lazily compare test cases across worker processes, yielding their reports in order
+
+    The raw test cases are read from raw_dir or, by test case index, from a splitter.py archive.
+    """
+    def raw(name: str) -> Optional[RawSource]:
+        if archive_path:
+            return archive_path, int(name[len("testcase"):]) - 1
+        return path.join(raw_dir, name) if raw_dir else None
+
+    batch = [
+        (name, path.join(oracle_dir, name + ".mmtp"), path.join(actual_dir, name + ".mmtp"), with_diff,
+         max_mismatches, raw(name))
+        for name in names
+    ]
+    with Pool(jobs or cpu_count()) as pool:
+        yield from pool.imap(compare_test_case, batch, chunksize=8)
+
+
+def describe_mismatch(mismatch: Dict[str, object]) -> str:
+    res = "SLE-%s record %d differs" % (mismatch["sle"], mismatch["record"])
+    if mismatch["field"]:
+        res += " in %s" % mismatch["field"]
+    elif mismatch["oracle"] is None:
+        res += ", unexpected record"
+    elif mismatch["actual"] is None:
+        res += ", missing record"
+    request = mismatch.get("request")
+    if request:
+        res += " (haskell request %d %s, line %d)" % (request["index"], request["type"], request["line"])
+    return res
+
+
+def junit_report(results: List[Dict[str, object]]) -> ElementTree:
+    """JUnit XML report of compared test cases, failures carrying their first mismatch"""
+    suite = Element("testsuite", name="translator", tests=str(len(results)),
+                    failures=str(sum(res["status"] == "fail" for res in results)),
+                    errors=str(sum(res["status"] in {"missing", "error"} for res in results)))
+    for res in results:
+        case = SubElement(suite, "testcase", classname="compare", name=res["name"])
+        if res["status"] == "missing":
+            SubElement(case, "error", message="missing %s" % ", ".join(res["missing"]))
+        elif res["status"] == "error":
+            SubElement(case, "error", message=res["error"])
+        elif res["status"] == "fail":
+            mismatch = res["mismatch"]
+            failure = SubElement(case, "failure", message=describe_mismatch(mismatch))
+            failure.text = "oracle: %s\nactual: %s\n" % (mismatch["oracle"], mismatch["actual"])
+    return ElementTree(suite)
+
+
+def colorize(line: str) -> str:
+    color = COLORS.get(line[0], "") if not line.startswith(("---", "+++")) else COLORS["@"]
+    return color + line.rstrip("\n") + "\033[0m\n" if color else line
+
+
+def main():
+    parser = ArgumentParser(
+        usage="\t%(prog)s [--feed DIR] [--oracle DIR] [--jobs N] [--report FILE] [--junit FILE]\n"
+              "\t\t[--no-diff | --max-mismatches N] [--raw DIR | --archive FILE] [--range START:STOP]\n"
+              "\t\t[--manifest FILE] <mmtp_output_dir>")
+    parser.add_argument("actual_dir")
+    parser.add_argument("--feed", default="feed", help="directory of the translated feeds (default: feed)")
+    parser.add_argument("--oracle", default="oracle", help="directory of the translated oracles (default: oracle)")
+    parser.add_argument("--color", choices=["auto", "always", "never"], default="auto")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument("--report", metavar="FILE", help="write a JSON report of every test case to FILE")
+    parser.add_argument("--junit", metavar="FILE", help="write a JUnit XML report to FILE")
+    parser.add_argument("--no-diff", action="store_true",
+                        help="stream the comparison of each test case, stopping at its first mismatch, without diffs")
+    parser.add_argument("--max-mismatches", type=int, default=None, metavar="N",
+                        help="like --no-diff, but stop after N mismatches per test case")
+    parser.add_argument("--raw", metavar="DIR",
+                        help="raw test cases (splitter.py output) to trace mismatches back to their haskell request")
+    parser.add_argument("--archive", metavar="FILE",
+                        help="like --raw, from a splitter.py --archive packed test suite, whose test cases are then "
+                             "compared even if their feed is missing")
+    parser.add_argument("--range", metavar="START:STOP",
+                        help="only compare these test cases (0-based indices in test case order, STOP excluded)")
+    parser.add_argument("--manifest", metavar="FILE", help="only compare the test cases of a selection.py manifest")
+    args = parser.parse_args()
+    streamed = args.no_diff or args.max_mismatches is not None
+
+    color = args.color == "always" or (args.color == "auto" and stdout.isatty())
+    if args.archive:
+        names = [test_case_name(idx) for idx in parse_range(args.range, len(open_archive(args.archive)))]
+    else:
+        names = select_range((f.replace(".mmtp", "") for f in listdir(args.feed)), args.range)
+    if args.manifest:
+        from selection import load_manifest
+        selected = load_manifest(args.manifest)
+        names = [name for name in names if name in selected]
+    results = []
+    for res in compare_suite(names, args.oracle, args.actual_dir, args.jobs, not streamed, args.max_mismatches,
+                             args.raw, args.archive):
+        results.append(res)
+        for mmtp_path in res["missing"]:
+            print("%s: No such file or directory" % mmtp_path, file=stderr)
+        if streamed:
+            if res["status"] != "pass":
+                print("%s: %s" % (res["name"], res["status"]))
+                for mismatch in res["mismatches"]:
+                    print("  " + describe_mismatch(mismatch))
+            continue
+        print(res["name"])
+        stdout.writelines(map(colorize, res["diff"]) if color else res["diff"])
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump([{k: v for k, v in res.items() if k != "diff"} for res in results], f, indent=2)
+    if args.junit:
+        junit_report(results).write(args.junit, encoding="unicode", xml_declaration=True)
+
+    failed = sum(res["status"] != "pass" for res in results)
+    if streamed:
+        print("%d/%d test case(s) differ" % (failed, len(results)))
+    exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+
+from argparse import ArgumentParser
+from collections import deque
+from random import Random
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+ADMIN_RQS = [
+    "SetReferencePriceRq\t%d",
+    "SetStaticPriceBandUpperLimitRq\t0.9",
+    "SetStaticPriceBandLowerLimitRq\t0.9",
+    "SetTotalSharesRq\t1000000",
+    "SetOwnershipUpperLimitRq\t1",
+    "SetTickSizeRq\t1",
+    "SetLotSizeRq\t1",
+]
+
+
+class Order:
+    """resting order of the synthetic matching engine"""
+    __slots__ = ("id", "order_type", "broker", "shareholder", "price", "qty", "side", "min_qty", "fak", "disclosed")
+
+    def __init__(self, id: int, order_type: str, broker: int, shareholder: int, price: int, qty: int, side: str,
+                 min_qty: int, fak: bool, disclosed: int):
+        self.id = id
+        self.order_type = order_type
+        self.broker = broker
+        self.shareholder = shareholder
+        self.price = price
+        self.qty = qty
+        self.side = side
+        self.min_qty = min_qty
+        self.fak = fak
+        self.disclosed = disclosed
+
+    def request(self, order_request_type: str, old_id: Optional[int] = None) -> str:
+        return "\t".join([
+            order_request_type, "" if old_id is None else str(old_id), self.order_type, str(self.id), str(self.broker),
+            str(self.shareholder), str(self.price), str(self.qty), self.side, str(self.min_qty),
+            "true" if self.fak else "false", str(self.disclosed),
+        ])
+
+    def queued(self) -> str:
+        return "\t".join([
+            "Order", self.order_type, str(self.id), str(self.broker), str(self.shareholder), str(self.price),
+            str(self.qty), self.side, str(self.min_qty), "true" if self.fak else "false", str(self.disclosed),
+        ])
+
+
+class TraceGenerator:
+    """Price-time priority matching engine producing valid haskell output traces
+
+    Passive orders build the book up to `depth` queued orders around the reference price; past it, aggressive orders
+    sweep about `fanout` queued orders each. `cancel_ratio` & `replace_ratio` of the requests cancel or replace a
+    queued order, a few of them targeting an unknown order to get rejected.
+    """
+    rnd: Random
+    depth: int
+    fanout: int
+    cancel_ratio: float
+    replace_ratio: float
+    fak_ratio: float
+    iceberg_ratio: float
+    reference_price: int
+    spread: int
+    brokers: int
+    shareholders: int
+    orders: Dict[int, Order]
+    levels: Dict[str, Dict[int, Deque[int]]]
+    next_id: int
+
+    def __init__(self, seed: int = 0, depth: int = 20, fanout: int = 2, cancel_ratio: float = 0.1,
+                 replace_ratio: float = 0.1, fak_ratio: float = 0.05, iceberg_ratio: float = 0.05,
+                 reference_price: int = 1000, brokers: int = 4, shareholders: int = 8, first_id: int = 1):
+        self.rnd = Random(seed)
+        self.depth = depth
+        self.fanout = fanout
+        self.cancel_ratio = cancel_ratio
+        self.replace_ratio = replace_ratio
+        self.fak_ratio = fak_ratio
+        self.iceberg_ratio = iceberg_ratio
+        self.reference_price = reference_price
+        self.spread = max(1, min(depth, reference_price // 20))
+        self.brokers = brokers
+        self.shareholders = shareholders
+        self.orders = {}
+        self.levels = {"BUY": {}, "SELL": {}}
+        self.next_id = first_id
+
+    def _new_id(self) -> int:
+        self.next_id += 1
+        return self.next_id - 1
+
+    def _queue(self, order: Order) -> None:
+        self.orders[order.id] = order
+        self.levels[order.side].setdefault(order.price, deque()).append(order.id)
+
+    def _dequeue(self, order: Order) -> None:
+        del self.orders[order.id]
+        level = self.levels[order.side][order.price]
+        level.remove(order.id)
+        if not level:
+            del self.levels[order.side][order.price]
+
+    def _crossing(self, order: Order) -> List[int]:
+        """queued order ids matching `order`, in priority order"""
+        opposite = self.levels["SELL" if order.side == "BUY" else "BUY"]
+        if order.side == "BUY":
+            prices = sorted(price for price in opposite if price <= order.price)
+        else:
+            prices = sorted((price for price in opposite if price >= order.price), reverse=True)
+        return [order_id for price in prices for order_id in opposite[price]]
+
+    def _match(self, order: Order) -> Optional[List[str]]:
+        """match an incoming order, returning its trades, or None if it is eliminated"""
+        crossing = self._crossing(order)
+        if order.min_qty and min(order.qty, sum(self.orders[i].qty for i in crossing)) < order.min_qty:
+            return None
+        trades = []
+        for order_id in crossing:
+            if order.qty == 0:
+                break
+            queued = self.orders[order_id]
+            qty = min(order.qty, queued.qty)
+            order.qty -= qty
+            queued.qty -= qty
+            buy_id, sell_id = (order.id, queued.id) if order.side == "BUY" else (queued.id, order.id)
+            trades.append("%d\t%d\t%d\t%d" % (queued.price, qty, buy_id, sell_id))
+            if queued.qty == 0:
+                self._dequeue(queued)
+        if order.qty and not order.fak:
+            self._queue(order)
+        return trades
+
+    def _state(self) -> List[str]:
+        res = ["Orders\t%d" % len(self.orders)]
+        res += [order.queued() for order in self.orders.values()]
+        res.append("Credits\t%d" % self.brokers)
+        res += ["%d\t%d" % (broker, 10 ** 9) for broker in range(1, self.brokers + 1)]
+        res.append("Ownerships\t%d" % self.shareholders)
+        res += ["%d\t%d" % (shareholder, 10 ** 6) for shareholder in range(1, self.shareholders + 1)]
+        res += [
+            "ReferencePrice\t%d" % self.reference_price,
+            "StaticPriceBandLowerLimit\t0.9",
+            "StaticPriceBandUpperLimit\t0.9",
+            "TotalShares\t1000000",
+            "OwnershipUpperLimit\t1",
+            "TickSize\t1",
+            "LotSize\t1",
+        ]
+        return res
+
+    def _random_order(self, side: str = None) -> Order:
+        rnd = self.rnd
+        side = side or rnd.choice(["BUY", "SELL"])
+        qty = rnd.randint(1, 100)
+        iceberg = rnd.random() < self.iceberg_ratio
+        offset = rnd.randint(1, self.spread)
+        price = self.reference_price - offset if side == "BUY" else self.reference_price + offset
+        return Order(self._new_id(), "Iceberg" if iceberg else "Limit", rnd.randint(1, self.brokers),
+                     rnd.randint(1, self.shareholders), price, qty, side, 0, False,
+                     rnd.randint(1, qty) if iceberg else 0)
+
+    def _aggressive_order(self) -> Order:
+        """order crossing the spread, sized to sweep about `fanout` queued orders"""
+        rnd = self.rnd
+        order = self._random_order()
+        opposite = self.levels["SELL" if order.side == "BUY" else "BUY"]
+        if opposite:
+            worst = max(opposite) if order.side == "BUY" else min(opposite)
+            order.price = worst
+            crossing = self._crossing(order)[:self.fanout]
+            order.qty = sum(self.orders[i].qty for i in crossing) or order.qty
+        order.fak = rnd.random() < self.fak_ratio
+        if rnd.random() < self.fak_ratio:
+            order.min_qty = rnd.randint(1, 2 * order.qty)
+        return order
+
+    def _order_request(self, order: Order, order_request_type: str, old: Order = None) -> List[str]:
+        rs = order_request_type[:-2] + "Rs"
+        if old is not None:
+            self._dequeue(old)
+        trades = self._match(order)
+        if trades is None:
+            if old is not None:
+                self._queue(old)
+            return ["%s\tEliminated" % rs, "Trades\t0"] + self._state()
+        return ["%s\tAccepted" % rs, "Trades\t%d" % len(trades)] + trades + self._state()
+
+    def request(self) -> Tuple[str, List[str]]:
+        """generate the next request & its response group"""
+        rnd = self.rnd
+        r = rnd.random()
+        if r < self.cancel_ratio:
+            old_id = rnd.choice(list(self.orders)) if self.orders and rnd.random() < 0.95 else self._new_id()
+            old = self.orders.get(old_id)
+            rq = "CancelOrderRq\t%d\t\t%d\t\t\t\t\t%s" % (old_id, self._new_id(), old.side if old else "BUY")
+            if old is None:
+                return rq, ["CancelOrderRs\tRejected"] + self._state()
+            self._dequeue(old)
+            return rq, ["CancelOrderRs\tAccepted"] + self._state()
+
+        if r < self.cancel_ratio + self.replace_ratio and self.orders:
+            old = self.orders[rnd.choice(list(self.orders))]
+            order = self._random_order(old.side)
+            return order.request("ReplaceOrderRq", old.id), self._order_request(order, "ReplaceOrderRq", old)
+
+        order = self._random_order() if len(self.orders) < self.depth else self._aggressive_order()
+        if rnd.random() < 0.01:
+            order.price = self.reference_price * 3
+            return order.request("NewOrderRq"), ["NewOrderRs\tRejected", "Trades\t0"] + self._state()
+        return order.request("NewOrderRq"), self._order_request(order, "NewOrderRq")
+
+    def admin_requests(self) -> List[str]:
+        rqs = [rq % self.reference_price if "%d" in rq else rq for rq in ADMIN_RQS]
+        rqs += ["SetCreditRq\t%d\t%d" % (broker, 10 ** 9) for broker in range(1, self.brokers + 1)]
+        rqs += ["SetOwnershipRq\t%d\t%d" % (shareholder, 10 ** 6) for shareholder in range(1, self.shareholders + 1)]
+        return rqs
+
+    def trace(self, requests: int) -> List[str]:
+        """lines of a haskell output trace: request count, requests, then responses"""
+        rqs = self.admin_requests()
+        rss = [rq.split("\t")[0][:-2] + "Rs\tAccepted" for rq in rqs]
+        for _ in range(requests):
+            rq, rs = self.request()
+            rqs.append(rq)
+            rss += rs
+        return [str(len(rqs))] + rqs + rss
+
+
+def generate_trace(requests: int, seed: int = 0, **kwargs) -> List[str]:
+    return TraceGenerator(seed, **kwargs).trace(requests)
+
+
+def generate_multi_trace(securities: int, requests: int, seed: int = 0, **kwargs) -> List[str]:
+    """lines of a multi-security trace (see shard.py): independent securities, with disjoint order ids, whose
+    requests are randomly interleaved and prefixed with their security id"""
+    rnd = Random(seed)
+    generators = {
+        "SEC%03d" % idx: TraceGenerator(seed + idx, first_id=1 + idx * 10 ** 6, **kwargs) for idx in range(securities)
+    }
+    rqs = []
+    rss = []
+    for security_id, generator in generators.items():
+        for rq in generator.admin_requests():
+            rqs.append("%s\t%s" % (security_id, rq))
+            rss.append(rq.split("\t")[0][:-2] + "Rs\tAccepted")
+    for _ in range(requests):
+        security_id = rnd.choice(list(generators))
+        rq, rs = generators[security_id].request()
+        rqs.append("%s\t%s" % (security_id, rq))
+        rss += rs
+    return [str(len(rqs))] + rqs + rss
+
+
+def generate_suite(test_cases: int, requests: int, seed: int = 0, **kwargs) -> List[str]:
+    """lines of a test suite: test case count, then the test case traces separated by blank lines"""
+    res = [str(test_cases)]
+    for idx in range(test_cases):
+        res += generate_trace(requests, seed + idx, **kwargs)
+        res.append("")
+    return res
+
+
+def main():
+    parser = ArgumentParser(usage="\t%(prog)s [options] <output>")
+    parser.add_argument("output")
+    parser.add_argument("--test-cases", type=int, default=None,
+                        help="write a test suite of that many traces instead of a single trace")
+    parser.add_argument("--securities", type=int, default=None,
+                        help="write a single multi-security trace (see shard.py) of that many securities")
+    parser.add_argument("--requests", type=int, default=1000, help="order requests per trace (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=20, help="queued orders in the book (default: %(default)s)")
+    parser.add_argument("--fanout", type=int, default=2, help="trades per aggressive order (default: %(default)s)")
+    parser.add_argument("--cancel", type=float, default=0.1, help="ratio of cancel requests (default: %(default)s)")
+    parser.add_argument("--replace", type=float, default=0.1, help="ratio of replace requests (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    kwargs = dict(depth=args.depth, fanout=args.fanout, cancel_ratio=args.cancel, replace_ratio=args.replace)
+    if args.securities is not None:
+        lines = generate_multi_trace(args.securities, args.requests, args.seed, **kwargs)
+    elif args.test_cases is None:
+        lines = generate_trace(args.requests, args.seed, **kwargs)
+    else:
+        lines = generate_suite(args.test_cases, args.requests, args.seed, **kwargs)
+    with open(args.output, "w") as f:
+        print("\n".join(lines), file=f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+
+import json
+from argparse import ArgumentParser
+from collections import deque
+from multiprocessing import Pool
+from os import cpu_count, makedirs, path
+from queue import Queue
+from shlex import split
+from socket import AF_UNIX, SHUT_WR, SOCK_STREAM, socket
+from subprocess import PIPE, TimeoutExpired, run
+from sys import stderr, stdout
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from compare import colorize, compare_test_case, describe_mismatch, junit_report
+from haskell2mmtp import format_error, convert_lines
+from splitter import split_test_cases, test_case_name
+
+# runs the SUT on a feed file, writing its MMTP output to an actual file; returns the failure message if any
+Sut = Callable[[str, str], Optional[str]]
+
+
+def command_sut(cmd: List[str], timeout: float = None) -> Sut:
+    """SUT reading the feed on its standard input & writing its MMTP output on its standard output"""
+    def run_sut(feed_path: str, actual_path: str) -> Optional[str]:
+        with open(feed_path, "rb") as feed, open(actual_path, "wb") as actual:
+            try:
+                proc = run(cmd, stdin=feed, stdout=actual, stderr=PIPE, timeout=timeout)
+            except TimeoutExpired:
+                return "SUT timed out after %gs" % timeout
+        if proc.returncode:
+            return "SUT exited with status %d: %s" % (proc.returncode, proc.stderr.decode(errors="replace").strip())
+        return None
+    return run_sut
+
+
+def socket_sut(socket_path: str, timeout: float = None) -> Sut:
+    """SUT listening on a unix socket: one connection per test case, the feed is sent & the write side shut down,
+    then the MMTP output is read until the SUT closes the connection"""
+    def run_sut(feed_path: str, actual_path: str) -> Optional[str]:
+        with socket(AF_UNIX, SOCK_STREAM) as sock, open(feed_path, "rb") as feed, open(actual_path, "wb") as actual:
+            sock.settimeout(timeout)
+            try:
+                sock.connect(socket_path)
+                sock.sendfile(feed)
+                sock.shutdown(SHUT_WR)
+                for chunk in iter(lambda: sock.recv(1 << 16), b""):
+                    actual.write(chunk)
+            except OSError as e:
+                return "SUT socket %s: %s" % (socket_path, format_error(e))
+        return None
+    return run_sut
+
+
+def _translate_test_case(job: Tuple[str, List[str], str, str]) -> Tuple[str, Optional[str]]:
+    """pool worker: translate a test case, returning its name & the failure message if any"""
+    name, test_case, feed_path, oracle_path = job
+    try:
+        convert_lines(test_case, feed_path, oracle_path)
+    except Exception as e:
+        return name, format_error(e)
+    return name, None
+
+
+class Harness:
+    """Pipeline of translation, SUT execution & comparison of the test cases of a suite
+
+    Test cases are translated by a process pool, then queued for `sut_jobs` threads which each run the SUT on a feed
+    & compare its output with the oracle while the next test cases are translated. The queue holds at most `queue_size`
+    translated test cases, so translation does not run arbitrarily far ahead of the SUT.
+    """
+    sut: Sut
+    feed_dir: str
+    oracle_dir: str
+    actual_dir: str
+    jobs: Optional[int]
+    sut_jobs: int
+    queue_size: int
+    on_result: Callable[[Dict[str, object]], None]
+    results: Dict[str, Dict[str, object]]
+    _queue: Queue
+    _lock: Lock
+
+    def __init__(self, sut: Sut, feed_dir: str, oracle_dir: str, actual_dir: str, jobs: int = None, sut_jobs: int = 1,
+                 queue_size: int = None, on_result: Callable[[Dict[str, object]], None] = None):
+        self.sut = sut
+        self.feed_dir = feed_dir
+        self.oracle_dir = oracle_dir
+        self.actual_dir = actual_dir
+        self.jobs = jobs
+        self.sut_jobs = sut_jobs
+        self.queue_size = queue_size or 2 * sut_jobs
+        self.on_result = on_result or (lambda res: None)
+        self.results = {}
+        self._queue = Queue(self.queue_size)
+        self._lock = Lock()
+
+    def _paths(self, name: str) -> Tuple[str, str, str]:
+        return tuple(path.join(d, name + ".mmtp") for d in (self.feed_dir, self.oracle_dir, self.actual_dir))
+
+    def _result(self, res: Dict[str, object]) -> None:
+        with self._lock:
+            self.results[res["name"]] = res
+            self.on_result(res)
+
+    def _error(self, name: str, error: str) -> None:
+        self._result({"name": name, "status": "error", "error": error, "missing": [], "mismatch": None,
+                      "mismatches": [], "diff": []})
+
+    def _run_sut(self, with_diff: bool) -> None:
+        """SUT thread: execute & compare queued test cases until the None sentinel"""
+        for name in iter(self._queue.get, None):
+            feed_path, oracle_path, actual_path = self._paths(name)
+            try:
+                error = self.sut(feed_path, actual_path)
+            except Exception as e:
+                error = format_error(e)
+            if error:
+                self._error(name, error)
+                continue
+            try:
+                res = compare_test_case((name, oracle_path, actual_path, with_diff, None, None))
+            except Exception as e:
+                self._error(name, "comparison failed: %s" % format_error(e))
+                continue
+            self._result(res)
+
+    def _translate(self, test_cases: Iterator[List[str]]) -> Iterator[Tuple[str, Optional[str]]]:
+        """translate test cases in order, with at most queue_size + jobs of them submitted & not yet consumed
+
+        Test cases are read & submitted to the pool only as translations are consumed, so that while the SUT queue is
+        full neither the test cases nor their translations pile up in memory.
+        """
+        jobs = self.jobs or cpu_count()
+        pending = deque()
+        with Pool(jobs) as pool:
+            for idx, test_case in enumerate(test_cases):
+                name = test_case_name(idx)
+                pending.append(pool.apply_async(_translate_test_case, ((name, test_case) + self._paths(name)[:2],)))
+                if len(pending) >= self.queue_size + jobs:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+    def run(self, test_cases: Iterator[List[str]], with_diff: bool = True) -> List[Dict[str, object]]:
+        """translate, execute & compare test cases, returning their comparison reports in test case order"""
+        for d in (self.feed_dir, self.oracle_dir, self.actual_dir):
+            makedirs(d, exist_ok=True)
+        threads = [Thread(target=self._run_sut, args=(with_diff,), daemon=True) for _ in range(self.sut_jobs)]
+        for thread in threads:
+            thread.start()
+        names = []
+        try:
+            for name, error in self._translate(test_cases):
+                names.append(name)
+                if error:
+                    self._error(name, "translation failed: %s" % error)
+                else:
+                    self._queue.put(name)
+        finally:
+            for _ in threads:
+                self._queue.put(None)
+            for thread in threads:
+                thread.join()
+        return [self.results[name] for name in names]
+
+
+def main():
+    parser = ArgumentParser(
+        usage="\t%(prog)s (--sut CMD | --sut-socket PATH) [options] <input.mmtp> <feed_dir> <oracle_dir> <actual_dir>")
+    parser.add_argument("suite")
+    parser.add_argument("feed_dir")
+    parser.add_argument("oracle_dir")
+    parser.add_argument("actual_dir")
+    sut = parser.add_mutually_exclusive_group(required=True)
+    sut.add_argument("--sut", metavar="CMD", help="SUT command line, fed on stdin, writing its MMTP output on stdout")
+    sut.add_argument("--sut-socket", metavar="PATH", help="unix socket of a running SUT, one connection per test case")
+    parser.add_argument("--timeout", type=float, default=None, help="SUT timeout per test case, in seconds")
+    parser.add_argument("--jobs", type=int, default=None, help="translation worker processes (default: cpu count)")
+    parser.add_argument("--sut-jobs", type=int, default=1, help="test cases run by the SUT concurrently (default: 1)")
+    parser.add_argument("--queue", type=int, default=None,
+                        help="translated test cases waiting for the SUT at most (default: twice --sut-jobs)")
+    parser.add_argument("--report", metavar="FILE", help="write a JSON report of every test case to FILE")
+    parser.add_argument("--junit", metavar="FILE", help="write a JUnit XML report to FILE")
+    parser.add_argument("--no-diff", action="store_true", help="only print the failing test cases, without diffs")
+    parser.add_argument("--color", choices=["auto", "always", "never"], default="auto")
+    args = parser.parse_args()
+
+    color = args.color == "always" or (args.color == "auto" and stdout.isatty())
+
+    def on_result(res: Dict[str, object]) -> None:
+        print("%s: %s" % (res["name"], res["status"]))
+        if res["status"] == "error":
+            print("%s: %s" % (res["name"], res["error"]), file=stderr)
+        if args.no_diff:
+            for mismatch in res["mismatches"]:
+                print("  " + describe_mismatch(mismatch))
+        else:
+            stdout.writelines(map(colorize, res["diff"]) if color else res["diff"])
+        stdout.flush()
+
+    if args.sut:
+        run_sut = command_sut(split(args.sut), args.timeout)
+    else:
+        run_sut = socket_sut(args.sut_socket, args.timeout)
+    harness = Harness(run_sut, args.feed_dir, args.oracle_dir, args.actual_dir, args.jobs, args.sut_jobs, args.queue,
+                      on_result)
+    with open(args.suite) as src:
+        test_suite_size = int(next(src))
+        results = harness.run(split_test_cases(src), with_diff=not args.no_diff)
+    assert len(results) == test_suite_size, "incomplete source file"
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump([{k: v for k, v in res.items() if k != "diff"} for res in results], f, indent=2)
+    if args.junit:
+        junit_report(results).write(args.junit, encoding="unicode", xml_declaration=True)
+
+    failed = sum(res["status"] != "pass" for res in results)
+    print("%d/%d test case(s) passed" % (len(results) - failed, len(results)))
+    exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,78 +1,681 @@
 #!/usr/bin/env python3
 
 
-from operator import methodcaller
-from typing import List
-from sys import stderr, argv
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from contextlib import closing, nullcontext
+from itertools import chain, islice
+from mmap import ACCESS_READ, mmap
+from os import cpu_count, fstat, listdir, makedirs, path, remove
+from traceback import format_exception_only
+from typing import AnyStr, Callable, Collection, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+from sys import intern, stderr
 
 
-from translator import Translator
+from archive import RawSource, open_archive, parse_range, select_range
+from cache import DEFAULT_MAX_SIZE, TranslationCache, translator_config
+from checkpoint import fingerprint, load as load_checkpoint, save as save_checkpoint
+from parsed_trace import ParsedTrace, ParsedTraceCache
+from splitter import split_test_cases, test_case_name
+from stats import Stats, profiled
+from translator import FEED, ORACLE, Translator, translation_lines
 
 
-def preprocess(lines: List[str]) -> List[List[object]]:
-    def convert_type(itm: str):
-        itm = itm.strip()
-        try:
-            return int(itm)
-        except ValueError:
-            pass
-        if itm == "":
-            return None
-        elif itm.lower() in {"true", "fak"}:
-            return True
-        elif itm.lower() in {"false", "---"}:
-            return False
-        else:
-            return itm
+def convert_type(itm: str):
+    itm = itm.strip()
+    try:
+        return int(itm)
+    except ValueError:
+        pass
+    if itm == "":
+        return None
+    elif itm.lower() in {"true", "fak"}:
+        return True
+    elif itm.lower() in {"false", "---"}:
+        return False
+    else:
+        return intern(itm)
+
+
+def parse_line(line: str) -> List[object]:
+    """parse a stripped haskell line without any knowledge of its record type"""
+    line = line.split("\t")
+    if line[0].isnumeric():
+        line.insert(0, "Trade")
+    return list(map(convert_type, line))
+
+
+def _decode(tok: AnyStr) -> str:
+    return tok.decode() if isinstance(tok, bytes) else tok
+
+
+def _isnumeric(tok: bytes) -> bool:
+    return tok.isdigit() if tok.isascii() else tok.decode().isnumeric()
+
+
+# Column converters of the schema-aware tokenizer. Each one returns exactly what convert_type would, only their
+# fast path differs: integers are parsed straight from str or bytes, and words (message names, sides, statuses,
+# brokers, ...) are looked up in a cache of the already converted tokens.
+def _int(tok: AnyStr):
+    try:
+        return int(tok)
+    except ValueError:
+        return convert_type(_decode(tok))
+
+
+def _opt_int(tok: AnyStr):
+    return _int(tok) if tok.strip() else None
+
+
+_WORDS_CACHE_SIZE = 4096
+_words = {}
+
+
+def _word(tok: AnyStr):
+    try:
+        return _words[tok]
+    except KeyError:
+        res = convert_type(_decode(tok))
+        if len(_words) < _WORDS_CACHE_SIZE:
+            _words[tok] = res
+        return res
+
+
+_ORDER_RQ = [_word, _opt_int, _word, _int, _word, _word, _int, _int, _word, _int, _word, _int]
+_CANCEL_ORDER_RQ = [_word, _int, _word, _int, _word, _word, _opt_int, _opt_int, _word]
+# trades are (Trade, price, qty, buy_id, sell_id) & queued orders (tag, order_type, id, broker, ...)
+_TRADE = [_word, _int, _int, _int, _int]
+_ORDER = [_word, _word, _int, _word, _word, _int, _int, _word, _int, _word, _int]
+_COUNT = [_word, _int]
+# responses are (response type, status, ...)
+_RESPONSE = [_word, _word]
+RESPONSE_TYPES = ["NewOrderRs", "ReplaceOrderRs", "CancelOrderRs", "SetReferencePriceRs",
+                  "SetStaticPriceBandUpperLimitRs", "SetStaticPriceBandLowerLimitRs", "SetOwnershipRs", "SetCreditRs",
+                  "SetTickSizeRs", "SetLotSizeRs", "SetOwnershipUpperLimitRs", "SetTotalSharesRs"]
+
+SCHEMAS = {
+    "NewOrderRq": _ORDER_RQ,
+    "ReplaceOrderRq": _ORDER_RQ,
+    "CancelOrderRq": _CANCEL_ORDER_RQ,
+    "Trade": _TRADE,
+    "Trades": _COUNT,
+    "Orders": _COUNT,
+    "Credits": _COUNT,
+    "Ownerships": _COUNT,
+    **{response_type: _RESPONSE for response_type in RESPONSE_TYPES},
+}
+# record types followed by a block of records, with the schema of the block (None if the translator ignores it)
+BLOCKS = {
+    "Trades": _TRADE,
+    "Orders": _ORDER,
+    "Credits": None,
+    "Ownerships": None,
+}
+
+
+def _parse(tokens: List[AnyStr], schema: List) -> List[object]:
+    res = [conv(tok) for conv, tok in zip(schema, tokens)]
+    if len(tokens) > len(schema):
+        res += map(_word, tokens[len(schema):])
+    return res
+
+
+def parse_lines(lines: Iterable[AnyStr], skip_unused: bool = False, skip_blocks: Collection[str] = ()) -> \
+        Iterator[Optional[List[object]]]:
+    """lazily parse stripped haskell lines (str or bytes), skipping the blank ones
+
+    Each record is parsed with the column types of its record type (and of its enclosing block for the trades,
+    queued orders, ... following a response), which gives the same records as parse_line. With `skip_unused`, the
+    bodies of the Credits & Ownerships blocks, which the translator never looks at, are not parsed and are yielded
+    as None, like the bodies of the `skip_blocks` blocks.
+    """
+    lines = filter(None, lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    lines = chain([first], lines)
+    sep, isnumeric = (b"\t", _isnumeric) if isinstance(first, bytes) else ("\t", str.isnumeric)
 
-    lines = list(filter(None, lines))
-    lines = list(map(methodcaller("split", "\t"), lines))
     for line in lines:
-        if line[0].isnumeric():
-            line.insert(0, "Trade")
-    lines = list(map(lambda line: list(map(convert_type, line)), lines))
-    return lines
+        tokens = line.split(sep)
+        if isnumeric(tokens[0]):
+            tokens.insert(0, "Trade")
+        record = _parse(tokens, SCHEMAS.get(_word(tokens[0]), _COUNT))
+        yield record
 
+        if record[0] not in BLOCKS or not isinstance(record[1], int):
+            continue
+        schema = BLOCKS[record[0]]
+        if (schema is None and skip_unused) or record[0] in skip_blocks:
+            for _ in islice(lines, record[1]):
+                yield None
+            continue
+        for line in islice(lines, record[1]):
+            tokens = line.split(sep)
+            if isnumeric(tokens[0]):
+                tokens.insert(0, "Trade")
+            yield _parse(tokens, schema or _COUNT)
 
-def main():
-    if len(argv) not in {4, 5}:
-        print("usage:\t%s [<haskell_input>] <haskell_output> <feed.mmtp> <oracle.mmtp>" % argv[0], file=stderr)
-        exit(2)
 
-    if len(argv) == 5:
-        haskell_input_path = argv[1]
-        haskell_output_path = argv[2]
-        feed_path = argv[3]
-        oracle_path = argv[4]
-    else:
-        haskell_input_path = None
-        haskell_output_path = argv[1]
-        feed_path = argv[2]
-        oracle_path = argv[3]
+def read_lines(file_path: str) -> Iterator[bytes]:
+    """lazily read the stripped lines of a file through a memory map"""
+    with open(file_path, "rb") as f:
+        if fstat(f.fileno()).st_size == 0:
+            return
+        with mmap(f.fileno(), 0, access=ACCESS_READ) as mm:
+            yield from map(bytes.strip, iter(mm.readline, b""))
+
+
+def preprocess(lines: List[str]) -> List[List[object]]:
+    return list(parse_lines(lines))
+
+
+def parse_content(content: bytes) -> Tuple[int, List[List[object]]]:
+    """parse a whole haskell output, returning its request count & its preprocessed records"""
+    lines = list(filter(None, map(str.strip, content.decode().split("\n"))))
+    assert lines, "empty haskell output"
+    return int(lines[0]), preprocess(lines[1:])
+
+
+def write_channels(translation: Iterable[Tuple[str, str]], feed: TextIO, oracle: TextIO) -> None:
+    """write a streamed translation to its feed & oracle text streams, a stream left empty getting a blank line"""
+    files = {FEED: feed, ORACLE: oracle}
+    empty = {channel for channel, f in files.items() if not f.tell()}
+    for channel, line in translation:
+        files[channel].write(line + "\n")
+        empty.discard(channel)
+    for channel in empty:
+        files[channel].write("\n")
+
+
+def write_translation(translation: Iterable[Tuple[str, str]], feed_path: str, oracle_path: str) -> None:
+    """write a streamed translation to its feed & oracle MMTP files"""
+    with open(feed_path, "w") as feed, open(oracle_path, "w") as oracle:
+        write_channels(translation, feed, oracle)
 
+
+def skipped_blocks(options: Dict[str, object] = None) -> Tuple[str, ...]:
+    """blocks whose bodies need not be parsed for a translator with these options: the order book snapshots are only
+    read when checked"""
+    return ("Orders",) if options is not None and options.get("check_every", 1) == 0 else ()
+
+
+def translate_to(feed_path: str, oracle_path: str, request_count: int, records: Iterable[List[object]],
+                 responses: Iterable[List[object]] = None, stats: Stats = None,
+                 options: Dict[str, object] = None) -> None:
+    """translate parsed haskell records with a fresh Translator into feed & oracle MMTP files
+
+    `options` are the keyword arguments of the Translator. With `stats`, the translator is instrumented and the
+    parsing, translation & writing times are accumulated in it.
+    """
+    translator = Translator(**(options or {}))
+    if stats is None:
+        write_translation(translator.translate_iter(request_count, records, responses), feed_path, oracle_path)
+        return
+
+    stats.instrument(translator)
+    records = stats.timed_iter("parse", records)
+    if responses is not None:
+        responses = stats.timed_iter("parse", responses)
+    translation = stats.timed_iter("translate", translator.translate_iter(request_count, records, responses))
+    with stats.timer("write"):
+        write_translation(stats.count_output(translation), feed_path, oracle_path)
+    stats.count_memory(translator)
+    stats.test_cases += 1
+
+
+def translate_parsed(parsed: ParsedTraceCache, content: bytes, feed_path: str, oracle_path: str, stats: Stats = None,
+                     options: Dict[str, object] = None) -> None:
+    """translate a raw haskell output whose parsed trace is loaded from the parsed cache (or parsed & cached)"""
+    with stats.timer("parse") if stats is not None else nullcontext():
+        request_count, records = parsed.get(content, parse_content)
+    with closing(records) if isinstance(records, ParsedTrace) else nullcontext():
+        translate_to(feed_path, oracle_path, request_count, records, stats=stats, options=options)
+
+
+def convert(haskell_output_path: str, feed_path: str, oracle_path: str, haskell_input_path: str = None,
+            stats: Stats = None, options: Dict[str, object] = None, parsed: ParsedTraceCache = None) -> None:
+    """translate one haskell output file into its feed & oracle MMTP files
+
+    The request & response sections are read through two independent readers of the memory mapped file, so the trace
+    is streamed instead of being loaded in memory. With a `parsed` cache, text parsing is skipped for known traces.
+    """
     if haskell_input_path:
         with open(haskell_input_path) as f:
             haskell_feed = list(map(str.strip, f))[2:]
         haskell_feed = preprocess(haskell_feed)
 
-    with open(haskell_output_path) as f:
-        haskell_res = list(map(str.strip, f))
+    if parsed is not None:
+        with open(haskell_output_path, "rb") as f:
+            translate_parsed(parsed, f.read(), feed_path, oracle_path, stats, options)
+        return
+
+    with closing(read_lines(haskell_output_path)) as requests, closing(read_lines(haskell_output_path)) as responses:
+        request_count = int(next(requests))
+        requests = islice(filter(None, requests), request_count)
+        responses = islice(filter(None, responses), request_count + 1, None)
+
+        translate_to(feed_path, oracle_path, request_count, parse_lines(requests),
+                     parse_lines(responses, skip_unused=True, skip_blocks=skipped_blocks(options)), stats, options)
+
+
+def convert_lines(haskell_res: List[str], feed_path: str, oracle_path: str, stats: Stats = None,
+                  options: Dict[str, object] = None, parsed: ParsedTraceCache = None) -> None:
+    """translate the stripped lines of one haskell output into its feed & oracle MMTP files"""
+    if parsed is not None:
+        translate_parsed(parsed, raw_content(haskell_res), feed_path, oracle_path, stats, options)
+        return
     request_count = int(haskell_res[0])
-    haskell_res = haskell_res[1:]
-    haskell_res = preprocess(haskell_res)
+    records = parse_lines(haskell_res[1:], skip_unused=True, skip_blocks=skipped_blocks(options))
+    translate_to(feed_path, oracle_path, request_count, records, stats=stats, options=options)
+
+
+def convert_checkpointed(haskell_output_path: str, feed_path: str, oracle_path: str, checkpoint_path: str,
+                         every: int, resume: bool = False, options: Dict[str, object] = None) -> None:
+    """translate one haskell output like convert, saving a checkpoint every `every` requests
+
+    A checkpoint holds the translator state, the position of the next request & response group in the trace and the
+    sizes of the feed & oracle files once the previous requests are written. With `resume`, the outputs are truncated
+    to these sizes and the translation resumes from the checkpoint, e.g. after fixing the translator. The checkpoint
+    is removed once the translation is complete.
+    """
+    translator = Translator(**(options or {}))
+    trace = dict(fingerprint(haskell_output_path), config=translator_config(translator))
+    start = response_offset = 0
+    if resume:
+        checkpoint = load_checkpoint(checkpoint_path)
+        assert checkpoint["trace"] == trace, \
+            "checkpoint %s was saved for another haskell output or configuration" % checkpoint_path
+        translator.restore(checkpoint["state"])
+        start, response_offset = checkpoint["requests"], checkpoint["responses"]
+        for out_path, size in ((feed_path, checkpoint["feed_size"]), (oracle_path, checkpoint["oracle_size"])):
+            with open(out_path, "r+b") as f:
+                f.truncate(size)
+
+    with closing(read_lines(haskell_output_path)) as requests, closing(read_lines(haskell_output_path)) as responses, \
+            open(feed_path, "a" if resume else "w") as feed, open(oracle_path, "a" if resume else "w") as oracle:
+        request_count = int(next(requests))
+        requests = islice(filter(None, requests), start, request_count)
+        responses = islice(filter(None, responses), request_count + 1 + response_offset, None)
+        consumed = response_offset
+
+        def counted(records: Iterable[List[object]]) -> Iterator[List[object]]:
+            nonlocal consumed
+            for record in records:
+                consumed += 1
+                yield record
+
+        translated = translator.translate_requests(
+            request_count, parse_lines(requests),
+            counted(parse_lines(responses, skip_unused=True, skip_blocks=skipped_blocks(options))),
+            start, response_offset)
+
+        def checkpointed() -> Iterator[Tuple[List[str], List[str]]]:
+            for idx, item in enumerate(translated, start + 1):
+                yield item
+                # the lines of the idx first requests are written by now
+                if idx % every == 0 and idx < request_count:
+                    feed.flush()
+                    oracle.flush()
+                    save_checkpoint(checkpoint_path, {
+                        "trace": trace, "requests": idx, "responses": consumed, "feed_size": feed.tell(),
+                        "oracle_size": oracle.tell(), "state": translator.checkpoint(),
+                    })
+
+        write_channels(translation_lines(checkpointed(), resumed=resume), feed, oracle)
+    if path.exists(checkpoint_path):
+        remove(checkpoint_path)
+
+
+def raw_content(test_case: List[str]) -> bytes:
+    """content of the raw/ file splitter.py writes for a test case, so that --suite & --batch share cache entries"""
+    return ("\n".join(test_case) + "\n").encode()
+
+
+def format_error(e: Exception) -> str:
+    """one line message of an exception, its type included"""
+    return "".join(format_exception_only(type(e), e)).strip()
+
+
+def convert_cached(cache: Optional[TranslationCache], content: bytes, feed_path: str, oracle_path: str,
+                   translate: Callable[[], None]) -> Optional[bool]:
+    """reuse the cached outputs of a raw test case, or translate it & cache its outputs
+
+    Returns whether the cache was hit, None without a cache.
+    """
+    if cache is None:
+        translate()
+        return None
+    key = cache.key(content)
+    if cache.get(key, feed_path, oracle_path):
+        return True
+    translate()
+    cache.put(key, feed_path, oracle_path)
+    return False
+
+
+def profile_path(profile_dir: Optional[str], profile_cases: Optional[Set[str]], name: str) -> Optional[str]:
+    """where to dump the cProfile profile of a test case, None if it is not profiled"""
+    if profile_dir is None or (profile_cases and name not in profile_cases):
+        return None
+    return path.join(profile_dir, name + ".prof")
+
+
+def _convert_test_case(job: Tuple[str, RawSource, str, str, Optional[TranslationCache], bool, Optional[str],
+                                  Optional[Dict[str, object]], Optional[ParsedTraceCache]]) -> \
+        Tuple[str, Optional[str], Optional[bool], Optional[Dict[str, object]], Tuple[int, int]]:
+    """pool worker: convert a single test case, read from its raw/ file or sliced out of an archive
+
+    Returns its name, the failure message if any, the cache outcome, the statistics report if requested & the parsed
+    cache hits & misses.
+    """
+    name, src, feed_path, oracle_path, cache, with_stats, profile, options, parsed = job
+    stats = Stats() if with_stats else None
+    parsed_before = (parsed.hits, parsed.misses) if parsed is not None else (0, 0)
+    hit = None
+    try:
+        content = b""
+        if isinstance(src, tuple):
+            content = open_archive(src[0])[src[1]]
+        elif cache is not None:
+            with open(src, "rb") as f:
+                content = f.read()
+
+        def translate():
+            with profiled(profile):
+                if isinstance(src, tuple):
+                    convert_lines(content.decode().split("\n")[:-1], feed_path, oracle_path, stats, options, parsed)
+                else:
+                    convert(src, feed_path, oracle_path, stats=stats, options=options, parsed=parsed)
+        hit = convert_cached(cache, content, feed_path, oracle_path, translate)
+        error = None
+    except Exception as e:
+        error = format_error(e)
+    parsed_after = (parsed.hits, parsed.misses) if parsed is not None else (0, 0)
+    return name, error, hit, stats and stats.report(), (parsed_after[0] - parsed_before[0],
+                                                        parsed_after[1] - parsed_before[1])
+
 
-    translator = Translator()
-    translated_feed, translated_result = translator.translate(request_count, haskell_res)
-    translated_feed = list(filter(None, translated_feed))
-    translated_result = list(filter(None, translated_result))
+def _run_batch(batch: List[Tuple], jobs: int = None, cache: TranslationCache = None, stats: Stats = None,
+               parsed: ParsedTraceCache = None) -> List[str]:
+    """convert test case jobs across worker processes, merging their cache outcomes & statistics"""
+    failed = []
+    with Pool(jobs or cpu_count()) as pool:
+        for name, error, hit, report, (parsed_hits, parsed_misses) in pool.imap(_convert_test_case, batch,
+                                                                                 chunksize=16):
+            print(name)
+            if parsed is not None:
+                parsed.hits += parsed_hits
+                parsed.misses += parsed_misses
+            if hit is not None:
+                cache.hits += hit
+                cache.misses += not hit
+            if report is not None:
+                stats.merge(report)
+            if error:
+                print("%s: %s" % (name, error), file=stderr)
+                failed.append(name)
+    return failed
+
+
+def convert_batch(src_dir: str, feed_dir: str, oracle_dir: str, jobs: int = None, cache: TranslationCache = None,
+                  stats: Stats = None, profile_dir: str = None, profile_cases: Set[str] = None,
+                  options: Dict[str, object] = None, parsed: ParsedTraceCache = None, selected: Set[str] = None) -> \
+        List[str]:
+    """translate every test case of src_dir (splitter.py output), or the `selected` ones, into feed_dir & oracle_dir
+
+    Each test case gets a fresh Translator. A failing test case is reported on stderr and does not stop the batch.
+    The statistics of the workers are merged into `stats`.
+    Returns the names of the failed test cases.
+    """
+    names = [name for name in select_range(listdir(src_dir), None) if selected is None or name in selected]
+    batch = [
+        (name, path.join(src_dir, name), path.join(feed_dir, name + ".mmtp"), path.join(oracle_dir, name + ".mmtp"),
+         cache, stats is not None, profile_path(profile_dir, profile_cases, name), options, parsed)
+        for name in names
+    ]
+    return _run_batch(batch, jobs, cache, stats, parsed)
+
+
+def convert_archive(archive_path: str, feed_dir: str, oracle_dir: str, indices: range = None, jobs: int = None,
+                    cache: TranslationCache = None, stats: Stats = None, profile_dir: str = None,
+                    profile_cases: Set[str] = None, options: Dict[str, object] = None,
+                    parsed: ParsedTraceCache = None, selected: Set[str] = None) -> List[str]:
+    """translate the `indices` test cases (all by default) of a splitter.py archive into feed_dir & oracle_dir
+
+    Like convert_batch, but the workers map the archive & slice their test cases out of it instead of opening a file
+    per test case.
+    """
+    if indices is None:
+        indices = range(len(open_archive(archive_path)))
+    batch = [
+        (name, (archive_path, idx), path.join(feed_dir, name + ".mmtp"), path.join(oracle_dir, name + ".mmtp"),
+         cache, stats is not None, profile_path(profile_dir, profile_cases, name), options, parsed)
+        for idx, name in ((idx, test_case_name(idx)) for idx in indices)
+        if selected is None or name in selected
+    ]
+    return _run_batch(batch, jobs, cache, stats, parsed)
+
+
+def convert_suite(suite_path: str, feed_dir: str, oracle_dir: str, cache: TranslationCache = None,
+                  stats: Stats = None, profile_dir: str = None, profile_cases: Set[str] = None,
+                  options: Dict[str, object] = None, parsed: ParsedTraceCache = None, selected: Set[str] = None) -> \
+        List[str]:
+    """translate a whole test suite file in a single streaming pass, without splitting it into raw/ first
+
+    Each test case is translated as soon as its closing blank line is read, so only one test case is held in memory.
+    Only the `selected` test cases are translated, if given. A failing test case is reported on stderr and does not
+    stop the suite.
+    Returns the names of the failed test cases.
+    """
+    failed = []
+    with open(suite_path) as src:
+        test_suite_size = int(next(src))
+        idx = -1
+        for idx, test_case in enumerate(split_test_cases(src)):
+            name = test_case_name(idx)
+            if selected is not None and name not in selected:
+                continue
+            print(name)
+            feed_path = path.join(feed_dir, name + ".mmtp")
+            oracle_path = path.join(oracle_dir, name + ".mmtp")
+            profile = profile_path(profile_dir, profile_cases, name)
+            try:
+                content = raw_content(test_case) if cache is not None else b""
+
+                def translate():
+                    with profiled(profile):
+                        convert_lines(test_case, feed_path, oracle_path, stats, options, parsed)
+                convert_cached(cache, content, feed_path, oracle_path, translate)
+            except Exception as e:
+                print("%s: %s" % (name, format_error(e)), file=stderr)
+                failed.append(name)
+
+    assert idx+1 == test_suite_size, "incomplete source file"
+    return failed
+
+
+def test_case_names(src: str, batch: bool = False, archive: bool = False) -> List[str]:
+    """names of the test cases of a suite file, a raw/ directory (batch) or an archive, without reading them"""
+    if batch:
+        return select_range(listdir(src), None)
+    if archive:
+        return [test_case_name(idx) for idx in range(len(open_archive(src)))]
+    with open(src) as f:
+        return [test_case_name(idx) for idx in range(int(next(f)))]
+
+
+def read_test_cases(src: str, batch: bool = False, archive: bool = False, range_spec: str = None) -> \
+        Iterator[Tuple[str, List[str]]]:
+    """(name, stripped lines) of the test cases of a suite file, a raw/ directory (batch) or an archive, only those of
+    the START:STOP `range_spec` if given"""
+    if batch:
+        for name in select_range(listdir(src), range_spec):
+            with open(path.join(src, name)) as f:
+                yield name, list(map(str.strip, f))
+    elif archive:
+        src_archive = open_archive(src)
+        for idx in parse_range(range_spec, len(src_archive)):
+            yield test_case_name(idx), src_archive.lines(idx)
+    else:
+        with open(src) as f:
+            test_suite_size = int(next(f))
+            indices = parse_range(range_spec, test_suite_size)
+            idx = -1
+            for idx, test_case in enumerate(split_test_cases(f)):
+                if idx in indices:
+                    yield test_case_name(idx), test_case
+        assert idx+1 == test_suite_size, "incomplete source file"
+
+
+def main(argv: List[str] = None, prog: str = None):
+    parser = ArgumentParser(
+        prog=prog,
+        usage="\t%(prog)s [<haskell_input>] <haskell_output> <feed.mmtp> <oracle.mmtp>\n"
+              "\t%(prog)s --batch [--jobs N] [--cache DIR] <raw_dir> <feed_dir> <oracle_dir>\n"
+              "\t%(prog)s --suite [--cache DIR] <input.mmtp> <feed_dir> <oracle_dir>\n"
+              "\t%(prog)s --archive [--jobs N] [--cache DIR] <archive> <feed_dir> <oracle_dir>\n"
+              "\tany mode: [--parsed DIR] [--compact-feed] [--bounded-memory [--max-tombstones N]] [--check-every N]\n"
+              "\t          [--stats FILE] [--profile PATH [--profile-case NAME ...]]\n"
+              "\t--batch, --suite & --archive: [--range START:STOP] [--share-prefixes] [--manifest FILE]\n"
+              "\tsingle output: [--checkpoint FILE [--checkpoint-every N] [--resume]]")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--batch", action="store_true", help="translate every test case of a splitter.py directory")
+    parser.add_argument("--suite", action="store_true", help="translate a whole test suite file in one pass")
+    parser.add_argument("--archive", action="store_true",
+                        help="translate the test cases of a splitter.py --archive packed test suite")
+    parser.add_argument("--range", metavar="START:STOP",
+                        help="only translate these test cases of --batch, --suite & --archive (0-based indices in "
+                             "test case order, STOP excluded)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="worker processes for --batch & --archive (default: cpu count)")
+    parser.add_argument("--cache", metavar="DIR", help="reuse the outputs of unchanged test cases cached in DIR")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE >> 20, metavar="MiB",
+                        help="cache size limit, least recently used entries are evicted (default: %(default)s)")
+    parser.add_argument("--parsed", metavar="DIR",
+                        help="skip text parsing of the haskell outputs whose binary parsed trace is cached in DIR")
+    parser.add_argument("--compact-feed", action="store_true",
+                        help="merge consecutive price band setters into a single price band cycle of the feed")
+    parser.add_argument("--bounded-memory", action="store_true",
+                        help="evict the orders that left the order book from the translator state, keeping a compact "
+                             "tombstone of each (the evicted orders & the memory saved are part of the --stats report)")
+    parser.add_argument("--max-tombstones", type=int, default=None, metavar="N",
+                        help="with --bounded-memory, only keep the N latest tombstones so that memory stays constant; "
+                             "later references to forgotten orders are translated as references to unknown orders")
+    parser.add_argument("--check-every", type=int, default=1, metavar="N",
+                        help="check the translator order book view against every Nth haskell order book snapshot, "
+                             "0 to skip the snapshots altogether (default: %(default)s, every snapshot)")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="write per stage timings, request & SLE message counts and the maximum order book depth "
+                             "to FILE as JSON (cache hits are not translated, hence not counted)")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="dump a cProfile profile of the translation to PATH, a directory of <test case>.prof "
+                             "files with --batch, --suite & --archive")
+    parser.add_argument("--profile-case", metavar="NAME", action="append",
+                        help="only profile this test case of --batch, --suite & --archive (repeatable)")
+    parser.add_argument("--share-prefixes", action="store_true",
+                        help="translate the request prefixes shared by test cases only once, forking the translator "
+                             "state where they diverge (in a single process, without --cache, --parsed & --stats)")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="only translate the test cases of a selection.py manifest")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="save the translation state of a single haskell output to FILE every --checkpoint-every "
+                             "requests (removed once the translation completes)")
+    parser.add_argument("--checkpoint-every", type=int, default=100000, metavar="N",
+                        help="requests between checkpoints (default: %(default)s)")
+    parser.add_argument("--resume", action="store_true",
+                        help="resume the translation from --checkpoint, truncating the outputs to its position")
+    args = parser.parse_args(argv)
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint")
+    if args.checkpoint_every < 1:
+        parser.error("--checkpoint-every must be at least 1")
+    if args.check_every < 0:
+        parser.error("--check-every must be 0 or more")
+    if args.range and not (args.batch or args.suite or args.archive):
+        parser.error("--range only applies to --batch, --suite & --archive")
+    stats = Stats() if args.stats else None
+    options = {}
+    if args.bounded_memory:
+        options.update(bounded_memory=True, max_tombstones=args.max_tombstones)
+    if args.compact_feed:
+        options.update(compact_feed=True)
+    if args.check_every != 1:
+        options.update(check_every=args.check_every)
+    parsed = ParsedTraceCache(args.parsed) if args.parsed else None
+
+    if args.batch or args.suite or args.archive:
+        if len(args.paths) != 3 or args.batch + args.suite + args.archive > 1:
+            parser.print_usage(stderr)
+            exit(2)
+        if args.checkpoint:
+            parser.error("--checkpoint only applies to a single haskell output")
+        if args.share_prefixes and (args.cache or parsed is not None or stats is not None or args.profile):
+            parser.error("--share-prefixes cannot be combined with --cache, --parsed, --stats & --profile")
+        cache = None
+        if args.cache:
+            config = translator_config(Translator(**options))
+            cache = TranslationCache(args.cache, args.cache_size << 20, config)
+        if args.profile:
+            makedirs(args.profile, exist_ok=True)
+        profile_cases = set(args.profile_case) if args.profile_case else None
+        selected = None
+        if args.manifest:
+            from selection import load_manifest
+            selected = load_manifest(args.manifest)
+        if args.range and not args.archive:
+            in_range = set(select_range(test_case_names(args.paths[0], args.batch), args.range))
+            selected = in_range if selected is None else selected & in_range
+        if args.share_prefixes:
+            from prefix import convert_shared
+            test_cases = read_test_cases(args.paths[0], args.batch, args.archive, args.range)
+            if selected is not None:
+                test_cases = ((name, test_case) for name, test_case in test_cases if name in selected)
+            failed = convert_shared(test_cases, args.paths[1], args.paths[2], options)
+        elif args.batch:
+            failed = convert_batch(*args.paths, jobs=args.jobs, cache=cache, stats=stats, profile_dir=args.profile,
+                                   profile_cases=profile_cases, options=options, parsed=parsed, selected=selected)
+        elif args.archive:
+            indices = parse_range(args.range, len(open_archive(args.paths[0])))
+            failed = convert_archive(*args.paths, indices=indices, jobs=args.jobs, cache=cache, stats=stats,
+                                     profile_dir=args.profile, profile_cases=profile_cases, options=options,
+                                     parsed=parsed, selected=selected)
+        else:
+            failed = convert_suite(*args.paths, cache=cache, stats=stats, profile_dir=args.profile,
+                                   profile_cases=profile_cases, options=options, parsed=parsed, selected=selected)
+        if cache is not None:
+            cache.evict()
+            print(cache.stats(), file=stderr)
+        if parsed is not None:
+            print(parsed.stats(), file=stderr)
+        if stats is not None:
+            stats.dump(args.stats)
+        if failed:
+            print("%d test case(s) failed: %s" % (len(failed), " ".join(failed)), file=stderr)
+            exit(1)
+        return
+
+    if len(args.paths) == 4:
+        haskell_input_path, haskell_output_path, feed_path, oracle_path = args.paths
+    elif len(args.paths) == 3:
+        haskell_input_path = None
+        haskell_output_path, feed_path, oracle_path = args.paths
+    else:
+        parser.print_usage(stderr)
+        exit(2)
 
-    # print("\n".join(translated_feed))
-    # print("\n".join(translated_result))
+    if args.checkpoint:
+        if stats is not None or parsed is not None:
+            parser.error("--checkpoint cannot be combined with --stats & --parsed")
+        with profiled(args.profile):
+            convert_checkpointed(haskell_output_path, feed_path, oracle_path, args.checkpoint, args.checkpoint_every,
+                                 args.resume, options)
+        return
 
-    with open(feed_path, "w") as f:
-        print("\n".join(translated_feed), file=f)
-    with open(oracle_path, "w") as f:
-        print("\n".join(translated_result), file=f)
+    with profiled(args.profile):
+        convert(haskell_output_path, feed_path, oracle_path, haskell_input_path, stats, options, parsed)
+    if stats is not None:
+        stats.dump(args.stats)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+
+import json
+from argparse import ArgumentParser
+from collections import Counter
+from os import listdir, path
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from compare import MASKS
+from layouts import LAYOUTS, columns
+
+# records of an SLE message held before their matrices are compared
+CHUNK_ROWS = 1 << 16
+PAST_LAYOUT = "(past layout)"
+
+
+def _read_records(mmtp_path: str) -> Dict[str, List[bytes]]:
+    """unmasked records of the compared SLE messages of an MMTP output, by function code"""
+    res = {code: [] for code in MASKS}
+    try:
+        with open(mmtp_path, "rb") as f:
+            for line in f:
+                records = res.get(line[16:20].decode(errors="replace"))
+                if records is not None:
+                    records.append(line.rstrip(b"\r\n"))
+    except FileNotFoundError:
+        pass
+    return res
+
+
+def _matrix(records: List[bytes], width: int) -> "np.ndarray":
+    """fixed-width byte matrix of records, short ones padded with blanks"""
+    return np.frombuffer(b"".join(record.ljust(width) for record in records), dtype=np.uint8).reshape(-1, width)
+
+
+class FieldHistogram:
+    """Per field mismatch counts of the oracle & actual records of a whole suite
+
+    The n-th records of an SLE message in the oracle & actual outputs of a test case are paired, like compare.py
+    does. Paired records are buffered per SLE message & compared a chunk at a time as byte matrices: the volatile
+    columns are masked out as column slices of the equality matrix, then each field counts the records whose
+    columns differ. Unpaired records are counted as missing or unexpected.
+    """
+    fields: Counter
+    test_cases: Dict[str, set]
+    records: Counter
+    _pending: Dict[str, Tuple[List[bytes], List[bytes], List[str]]]
+
+    def __init__(self):
+        if np is None:
+            raise ImportError("histogram.py needs numpy, install it with: pip install numpy")
+        self.fields = Counter()
+        self.test_cases = {}
+        self.records = Counter()
+        self._pending = {code: ([], [], []) for code in MASKS}
+
+    def _count(self, key: str, name: str, n: int = 1) -> None:
+        self.fields[key] += n
+        self.test_cases.setdefault(key, set()).add(name)
+
+    def add(self, name: str, oracle_path: str, actual_path: str) -> None:
+        """account for the records of a test case"""
+        oracle, actual = _read_records(oracle_path), _read_records(actual_path)
+        for code in MASKS:
+            paired = min(len(oracle[code]), len(actual[code]))
+            self.records[code] += max(len(oracle[code]), len(actual[code]))
+            if len(oracle[code]) > paired:
+                self._count("SLE-%s missing record" % code, name, len(oracle[code]) - paired)
+            if len(actual[code]) > paired:
+                self._count("SLE-%s unexpected record" % code, name, len(actual[code]) - paired)
+            oracle_rows, actual_rows, names = self._pending[code]
+            oracle_rows += oracle[code][:paired]
+            actual_rows += actual[code][:paired]
+            names += [name] * paired
+            if len(names) >= CHUNK_ROWS:
+                self._flush(code)
+
+    def _flush(self, code: str) -> None:
+        oracle_rows, actual_rows, names = self._pending[code]
+        if not names:
+            return
+        width = max(max(map(len, oracle_rows)), max(map(len, actual_rows)))
+        differs = _matrix(oracle_rows, width) != _matrix(actual_rows, width)
+        for offset, mask_width in MASKS[code]:
+            differs[:, offset:offset + mask_width] = False
+
+        spans = [(offset, offset + field.width, field.name) for offset, field in columns(LAYOUTS[code])]
+        layout_width = spans[-1][1] if spans else 0
+        if width > layout_width:
+            spans.append((layout_width, width, PAST_LAYOUT))
+        for start, stop, field in spans:
+            rows = np.flatnonzero(differs[:, start:stop].any(axis=1))
+            if len(rows):
+                key = "SLE-%s %s" % (code, field)
+                self.fields[key] += len(rows)
+                self.test_cases.setdefault(key, set()).update(names[row] for row in rows)
+        for rows in self._pending[code]:
+            rows.clear()
+
+    def report(self) -> List[Dict[str, object]]:
+        """differing fields, most frequent first, with their record & test case counts"""
+        for code in MASKS:
+            self._flush(code)
+        return [
+            {"field": key, "records": count, "test_cases": len(self.test_cases[key])}
+            for key, count in sorted(self.fields.items(), key=lambda item: (-item[1], item[0]))
+        ]
+
+
+def main():
+    parser = ArgumentParser(
+        usage="\t%(prog)s [--oracle DIR] [--report FILE] <mmtp_output_dir>",
+        description="histogram of the differing fields of the oracle & actual SLE records of a whole suite")
+    parser.add_argument("actual_dir")
+    parser.add_argument("--oracle", default="oracle", help="directory of the translated oracles (default: oracle)")
+    parser.add_argument("--report", metavar="FILE", help="write the histogram to FILE as JSON")
+    args = parser.parse_args()
+
+    try:
+        histogram = FieldHistogram()
+    except ImportError as e:
+        parser.exit(2, "%s\n" % e)
+    names = [f.replace(".mmtp", "") for f in sorted(listdir(args.oracle))]
+    for name in names:
+        histogram.add(name, path.join(args.oracle, name + ".mmtp"), path.join(args.actual_dir, name + ".mmtp"))
+    report = histogram.report()
+
+    width = max((len(row["field"]) for row in report), default=0)
+    for row in report:
+        print("%-*s %8d record(s) %6d test case(s)" % (width, row["field"], row["records"], row["test_cases"]))
+    print("%d differing field(s) over %d record(s) of %d test case(s)" % (
+        len(report), sum(histogram.records.values()), len(names)))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    exit(1 if report else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Field:
+    """Fixed-width field of an SLE message
+
+    A field is either a value field, rendered from a translated value with its printf-style `spec`,
+    or a constant field whose `text` is folded into the compiled layout. Constant texts may refer to
+    the translator configuration (date, time, security_id, ...) with str.format placeholders.
+    """
+    name: str
+    width: int
+    spec: str = None
+    text: str = None
+    volatile: bool = False
+
+    def __post_init__(self):
+        assert (self.spec is None) != (self.text is None), "field %s should be either a value or a constant" % self.name
+        assert self.text is None or "{" in self.text or len(self.text) == self.width, \
+            "constant field %s should be %d characters wide" % (self.name, self.width)
+
+
+def value(name: str, width: int, spec: str = None, volatile: bool = False) -> Field:
+    """value field, left justified string by default"""
+    return Field(name, width, spec=spec if spec else "%%-%ds" % width, volatile=volatile)
+
+
+def constant(name: str, text: str, width: int = None, volatile: bool = False) -> Field:
+    return Field(name, width if width is not None else len(text), text=text, volatile=volatile)
+
+
+Layout = List[Field]
+
+SLE_0001_0002: Layout = [
+    value("order id", 16),
+    constant("function code", "{function_code}", 4),
+    constant("original order date", "{date}", 8),
+    value("original HON", 6, "%06d"),
+    constant("security", "{security_id:<12}", 12),
+    value("side", 1),
+    value("qty", 12, "%012d"),
+    value("type", 1),
+    value("price", 10, "2%07d00"),
+    value("validity type", 1),
+    constant("validity date", "%08d" % 0),
+    value("min qty", 12, "%012d"),
+    value("disclosed qty", 12, "%012d"),
+    value("broker", 8),
+    constant("technical origin", "A"),
+    constant("confirmation flag", "0"),
+    constant("preopening flag", "0"),
+    constant("trigger price", " %09d" % 0),
+    constant("filler", "%6s" % ""),
+    value("expected remaining qty", 12, "%012d"),
+    constant("filler", " 189980021"),
+    value("shareholder", 16),
+    constant("filler", "1       "),
+    constant("date", "{date}", 8),
+    constant("time", "{time}", 6),
+    constant("filler", "189-IR98001"),
+    constant("filler", "%26s" % ""),
+]
+
+SLE_0003: Layout = [
+    value("order id", 16),
+    constant("function code", "{function_code}", 4),
+    constant("original order date", "{date}", 8),
+    value("original HON", 6, "%06d"),
+    value("broker", 8),
+    constant("security", "{security_id:<12}", 12),
+    value("side", 1),
+]
+
+SLE_0105: Layout = [
+    value("order id", 16),
+    constant("function code", "0105"),
+    constant("date", "{date}", 8),
+    value("HON", 6, "%06d"),
+    constant("security", "{security_id:<12}", 12),
+    constant("group", "{group:<2}", 2),
+    value("side", 1),
+    value("qty", 12, "%012d"),
+    value("price", 10, "2%07d00"),
+    value("remaining qty flag", 1),
+    value("remaining qty", 12, "%012d"),
+    constant("counterpart broker", "%8s" % ""),
+    constant("counterpart origin", "1"),
+    constant("technical origin", "A"),
+    constant("filler", "%06d" % 0),
+    constant("trade date", "{date}", 8, volatile=True),
+    constant("trade time", "{time}", 6, volatile=True),
+    value("trade number", 7, "%07d"),
+    constant("settlement date", "{date}", 8, volatile=True),
+    value("type", 1),
+    value("validity type", 1),
+    constant("instrument category", "A"),
+    constant("filler", "%9s" % ""),
+    constant("filler", "189980021"),
+    value("shareholder", 16),
+    constant("filler", "1       "),
+    constant("date", "{date}", 8, volatile=True),
+    constant("time", "{time}", 6, volatile=True),
+    constant("filler", "189-IR98001"),
+    constant("timestamp", "{timestamp:0<20}", 20, volatile=True),
+    constant("filler", "%6s" % ""),
+    constant("filler", "00"),
+]
+
+# only the volatile columns of SLE-0138 are known, the translator never produces it
+SLE_0138: Layout = [
+    constant("unknown", "%95s" % ""),
+    constant("time", "{time}", 6, volatile=True),
+    constant("unknown", "%37s" % ""),
+    constant("date & time", "{date}{time}", 14, volatile=True),
+]
+
+SLE_0144: Layout = [
+    value("order id", 16),
+    constant("function code", "0144"),
+    value("original function code", 4),
+    constant("error code", "%06d" % 0, volatile=True),
+    constant("filler", "".ljust(71), volatile=True),
+]
+
+SLE_0172: Layout = [
+    value("order id", 16),
+    constant("function code", "0172"),
+    constant("date", "{date}", 8),
+    value("HON", 6, "%06d"),
+    value("status", 1),
+    constant("security", "{security_id:<12}", 12),
+    value("qty", 12, "%012d"),
+    value("side", 1),
+    value("price", 10, "2%07d00"),
+    value("broker", 8),
+    constant("filler", "%06d" % 0),
+    constant("time", "{time}", 6, volatile=True),
+    value("type", 1),
+    value("matched qty at entry", 12, "%012d"),
+    constant("original function code", "{function_code}", 4),
+    constant("original order date", "{original_date}", 8),
+    value("original HON", 6, "%06d"),
+    value("validity type", 1),
+    constant("validity date", "{validity_date}", 8),
+    value("min qty", 12, "%012d"),
+    value("disclosed qty", 12, "%012d"),
+    constant("technical origin", "A"),
+    constant("confirmation flag", "0"),
+    value("original remaining qty", 12, "%012d"),
+    constant("trigger price", " %09d" % 0),
+    constant("filler", "%06d" % 0),
+    constant("filler", " 189980021"),
+    value("shareholder", 16),
+    constant("filler", "1       "),
+    constant("date", "{date}", 8, volatile=True),
+    constant("time", "{time}", 6, volatile=True),
+    constant("filler", "189-IR98001"),
+    constant("filler", "%26s" % ""),
+    constant("timestamp", "{timestamp:0<20}", 20, volatile=True),
+]
+
+LAYOUTS: Dict[str, Layout] = {
+    "0001": SLE_0001_0002,
+    "0002": SLE_0001_0002,
+    "0003": SLE_0003,
+    "0105": SLE_0105,
+    "0138": SLE_0138,
+    "0144": SLE_0144,
+    "0172": SLE_0172,
+}
+
+
+def compile_layout(layout: Layout, **constants) -> str:
+    """precompile a layout into a single printf-style format string, folding its constant fields in
+
+    The value fields are then filled in, in layout order, with one `%` operation per message.
+    """
+    return "".join(
+        field.spec if field.text is None else field.text.format(**constants).replace("%", "%%")
+        for field in layout
+    )
+
+
+def columns(layout: Layout) -> List[Tuple[int, Field]]:
+    """nominal (offset, field) pairs of a layout"""
+    res = []
+    offset = 0
+    for field in layout:
+        res.append((offset, field))
+        offset += field.width
+    return res
+
+
+def field_at(layout: Layout, offset: int) -> Optional[Field]:
+    """field of a layout covering a column offset, None past the end of the layout"""
+    for start, field in columns(layout):
+        if start <= offset < start + field.width:
+            return field
+    return None
+
+
+def volatile_columns(layout: Layout) -> List[Tuple[int, int]]:
+    """(offset, width) of the volatile columns of a layout, adjacent ones merged, to be masked before comparison"""
+    res = []
+    for offset, field in columns(layout):
+        if not field.volatile:
+            continue
+        if res and sum(res[-1]) == offset:
+            res[-1] = (res[-1][0], res[-1][1] + field.width)
+        else:
+            res.append((offset, field.width))
+    return res
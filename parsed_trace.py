@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+
+import json
+from argparse import ArgumentParser
+from array import array
+from hashlib import sha256
+from mmap import ACCESS_READ, mmap
+from os import fstat, getpid, makedirs, path, replace
+from struct import Struct
+from sys import intern
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+# bump when the file layout or the parsed records change
+PARSED_FORMAT = 2
+MAGIC = b"HSKP%04d" % PARSED_FORMAT
+# magic, request count, record count, shape table size, object table size
+HEADER = Struct("<8sqqqq")
+# modules whose source determines the parsed records
+PARSER_SOURCES = ["haskell2mmtp.py", "parsed_trace.py"]
+ITEM_SIZES = {"b": 1, "B": 1, "h": 2, "H": 2, "i": 4, "I": 4, "q": 8}
+# column typecodes by increasing size, with the bound of their values: integers are signed, indices unsigned
+INT_TYPECODES = [("b", 1 << 7), ("h", 1 << 15), ("i", 1 << 31), ("q", 1 << 63)]
+REF_TYPECODES = [("B", 1 << 8), ("H", 1 << 16), ("I", 1 << 32)]
+# shape id of the None records of skipped blocks
+NO_SHAPE = (1 << 16) - 1
+
+Record = Optional[List[object]]
+
+
+def parser_version() -> str:
+    """hash of the parser sources, so that parsed traces of an older parser are never served"""
+    digest = sha256(MAGIC)
+    for name in PARSER_SOURCES:
+        with open(path.join(path.dirname(path.abspath(__file__)), name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _typecode(values: List[int], typecodes: List[Tuple[str, int]]) -> str:
+    """smallest typecode holding every value"""
+    low, high = min(values), max(values)
+    return next(typecode for typecode, bound in typecodes if -bound <= low and high < bound)
+
+
+def _pack(typecode: str, items: List[int]) -> bytes:
+    res = array(typecode, items)
+    assert res.itemsize == ITEM_SIZES[typecode], "unsupported %s array item size" % typecode
+    return res.tobytes()
+
+
+def dumps(request_count: int, records: Iterable[Record]) -> bytes:
+    """serialize parsed haskell records into a binary parsed trace
+
+    Records are grouped by shape: their arity & which of their values are integers. Each shape stores one typed
+    column per field, holding the field of its records in trace order: integers in the smallest of int8 to int64
+    holding the whole column, and any other value (word, None, boolean or huge integer) as the index of its entry in
+    an object table, in the smallest of uint8 to uint32, each distinct value being stored once. A uint16 column gives
+    the shape of every record. Every section is 8 bytes aligned.
+    """
+    objects, object_ids = [], {}
+    # (refs, columns) of each shape, refs telling which fields are object table indices
+    shapes, shape_ids = [], {}
+    record_shapes, row_counts = [], []
+    for record in records:
+        if record is None:
+            record_shapes.append(NO_SHAPE)
+            continue
+        refs = tuple(type(val) is not int or not -(1 << 63) <= val < 1 << 63 for val in record)
+        shape = shape_ids.get(refs)
+        if shape is None:
+            shape = shape_ids[refs] = len(shapes)
+            shapes.append((refs, [[] for _ in refs]))
+            row_counts.append(0)
+        row_counts[shape] += 1
+        for ref, val, column in zip(refs, record, shapes[shape][1]):
+            if ref:
+                key = (type(val), val)
+                if key not in object_ids:
+                    object_ids[key] = len(objects)
+                    objects.append(val)
+                val = object_ids[key]
+            column.append(val)
+        record_shapes.append(shape)
+    assert len(shapes) < NO_SHAPE, "too many record shapes"
+
+    sections = [_pack("H", record_shapes)]
+    shape_table = []
+    for (refs, columns), row_count in zip(shapes, row_counts):
+        typecodes = [_typecode(column, REF_TYPECODES if ref else INT_TYPECODES) for ref, column in zip(refs, columns)]
+        shape_table.append([row_count, "".join(typecodes), "".join("r" if ref else "v" for ref in refs)])
+        sections += [_pack(typecode, column) for typecode, column in zip(typecodes, columns)]
+    shape_table = json.dumps(shape_table).encode()
+    objects = json.dumps(objects).encode()
+    res = [HEADER.pack(MAGIC, request_count, len(record_shapes), len(shape_table), len(objects))]
+    for section in [shape_table, objects] + sections:
+        res += [section, b"\0" * (-len(section) % 8)]
+    return b"".join(res)
+
+
+class ParsedTrace:
+    """Binary parsed trace, whose records are built one at a time from its columns as it is iterated
+
+    `data` is bytes or a memory map, which the trace keeps open until it is closed.
+    """
+    request_count: int
+    record_count: int
+    _data: object
+    _views: List[memoryview]
+    _record_shapes: memoryview
+    _shapes: List[Tuple[memoryview, ...]]
+    _refs: List[Tuple[bool, ...]]
+    _objects: List[object]
+
+    def __init__(self, data):
+        magic, self.request_count, self.record_count, shapes_size, objects_size = HEADER.unpack_from(data)
+        assert magic == MAGIC, "not a parsed trace of format %d" % PARSED_FORMAT
+        self._data = data
+        self._views = [memoryview(data)]
+        offset = HEADER.size
+
+        def section(size: int) -> memoryview:
+            nonlocal offset
+            res = self._views[0][offset:offset + size]
+            assert len(res) == size, "truncated parsed trace"
+            offset += size + -size % 8
+            self._views.append(res)
+            return res
+
+        shape_table = json.loads(bytes(section(shapes_size)))
+        self._objects = [intern(obj) if type(obj) is str else obj for obj in json.loads(bytes(section(objects_size)))]
+        self._record_shapes = section(2 * self.record_count).cast("H")
+        self._shapes = []
+        self._refs = []
+        for row_count, typecodes, refs in shape_table:
+            self._shapes.append(tuple(
+                section(ITEM_SIZES[typecode] * row_count).cast(typecode) for typecode in typecodes))
+            self._refs.append(tuple(ref == "r" for ref in refs))
+        self._views += self._record_shapes, *(column for columns in self._shapes for column in columns)
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def __iter__(self) -> Iterator[Record]:
+        objects = self._objects
+        rows = [0] * len(self._shapes)
+        for shape in self._record_shapes:
+            if shape == NO_SHAPE:
+                yield None
+                continue
+            row = rows[shape]
+            rows[shape] = row + 1
+            yield [
+                objects[column[row]] if ref else column[row]
+                for column, ref in zip(self._shapes[shape], self._refs[shape])
+            ]
+
+    def close(self) -> None:
+        """release the columns & close the memory map"""
+        for view in reversed(self._views):
+            view.release()
+        if isinstance(self._data, mmap):
+            self._data.close()
+
+    def __enter__(self) -> "ParsedTrace":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def loads(data) -> Tuple[int, ParsedTrace]:
+    """deserialize a binary parsed trace (bytes or memory map), returning its request count & lazy records"""
+    trace = ParsedTrace(data)
+    return trace.request_count, trace
+
+
+def save(file_path: str, request_count: int, records: Iterable[Record]) -> None:
+    """write a binary parsed trace atomically"""
+    tmp_path = "%s.%d.tmp" % (file_path, getpid())
+    with open(tmp_path, "wb") as f:
+        f.write(dumps(request_count, records))
+    replace(tmp_path, file_path)
+
+
+def load(file_path: str) -> Tuple[int, ParsedTrace]:
+    """map a binary parsed trace, returning its request count & lazy records, which keep the file mapped"""
+    with open(file_path, "rb") as f:
+        assert fstat(f.fileno()).st_size >= HEADER.size, "truncated parsed trace %s" % file_path
+        mm = mmap(f.fileno(), 0, access=ACCESS_READ)
+    try:
+        return loads(mm)
+    except BaseException:
+        mm.close()
+        raise
+
+
+def same_records(records: Iterable[Record], other: Iterable[Record]) -> bool:
+    """whether two record sequences are equal, value types included (True is not 1)"""
+    def typed(recs: Iterable[Record]) -> List[Optional[List[Tuple[type, object]]]]:
+        return [rec if rec is None else [(type(val), val) for val in rec] for rec in recs]
+    return typed(records) == typed(other)
+
+
+def check_round_trip(request_count: int, records: List[Record], parsed_trace: bytes = None) -> None:
+    """assert that records come back unchanged from their binary parsed trace"""
+    loaded_count, loaded = loads(parsed_trace if parsed_trace is not None else dumps(request_count, records))
+    assert loaded_count == request_count and same_records(records, loaded), "parsed trace round trip mismatch"
+
+
+class ParsedTraceCache:
+    """On-disk cache of parsed haskell traces, keyed by the hash of their raw content & of the parser sources
+
+    Entries are binary parsed traces written atomically, so several processes may share a cache directory.
+    """
+    cache_dir: str
+    version: bytes
+    hits: int
+    misses: int
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.version = parser_version().encode()
+        self.hits = 0
+        self.misses = 0
+        makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, content: bytes) -> str:
+        return path.join(self.cache_dir, sha256(self.version + b"\n" + content).hexdigest() + ".hskp")
+
+    def get(self, content: bytes, parse: Callable[[bytes], Tuple[int, List[Record]]]) -> \
+            Tuple[int, Iterable[Record]]:
+        """load the parsed trace of a raw haskell output, or parse it with `parse` & store it"""
+        entry_path = self._entry_path(content)
+        try:
+            res = load(entry_path)
+        except (FileNotFoundError, AssertionError):
+            pass
+        else:
+            self.hits += 1
+            return res
+        self.misses += 1
+        request_count, records = parse(content)
+        save(entry_path, request_count, records)
+        return request_count, records
+
+    def stats(self) -> str:
+        return "parsed cache: %d hits, %d misses" % (self.hits, self.misses)
+
+
+def main():
+    from haskell2mmtp import parse_content
+
+    parser = ArgumentParser(
+        usage="\t%(prog)s <haskell_output> [<parsed_trace>]",
+        description="check that a haskell output survives the binary parsed trace round trip, optionally saving it")
+    parser.add_argument("haskell_output")
+    parser.add_argument("parsed_trace", nargs="?", help="write the parsed trace to this file")
+    args = parser.parse_args()
+
+    with open(args.haskell_output, "rb") as f:
+        request_count, records = parse_content(f.read())
+    parsed_trace = dumps(request_count, records)
+    check_round_trip(request_count, records, parsed_trace)
+    if args.parsed_trace:
+        with open(args.parsed_trace, "wb") as f:
+            f.write(parsed_trace)
+    print("%s: %d requests, %d records, round trip ok" % (args.haskell_output, request_count, len(records)))
+
+
+if __name__ == '__main__':
+    main()
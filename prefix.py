@@ -0,0 +1,129 @@
+import re
+from os import path
+from sys import stderr
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from haskell2mmtp import format_error, convert_lines, parse_lines, skipped_blocks, write_translation
+from translator import Translator, translation_lines
+
+# end of a response type, which opens a response group when it is the first column of its line
+RESPONSE_TYPE_END = re.compile(r"Rs(?=[\t\n]|$)")
+
+# a request of a test case with its response group (lines joined) & the next request, which the translation of the
+# request may depend on (price band setters of a compacted feed)
+Step = Tuple[str, str, Optional[str]]
+
+
+class Node:
+    """Trie node of the test cases sharing the steps on the path leading to it
+
+    `cases` are the test cases whose last step leads to the node.
+    """
+    __slots__ = ("children", "cases")
+
+    def __init__(self):
+        self.children: Dict[Step, "Node"] = {}
+        self.cases: List[str] = []
+
+
+def steps(test_case: List[str]) -> Optional[List[Step]]:
+    """steps of the stripped lines of a test case, None if its response groups do not match its requests"""
+    test_case = list(filter(None, test_case))
+    if not test_case or not test_case[0].isnumeric():
+        return None
+    request_count = int(test_case[0])
+    requests = test_case[1:request_count + 1]
+    responses = "\n".join(test_case[request_count + 1:])
+    starts = []
+    for match in RESPONSE_TYPE_END.finditer(responses):
+        start = responses.rfind("\n", 0, match.start()) + 1
+        if "\t" not in responses[start:match.start()]:
+            starts.append(start)
+    if len(requests) != request_count or len(starts) != request_count or (starts and starts[0]):
+        return None
+    groups = [responses[start:stop].rstrip("\n") for start, stop in zip(starts, starts[1:] + [len(responses)])]
+    return [
+        (rq, group, requests[idx + 1] if idx + 1 < request_count else None)
+        for idx, (rq, group) in enumerate(zip(requests, groups))
+    ]
+
+
+def _translate_step(translator: Translator, idx: int, step: Step, options: Dict[str, object]) -> \
+        Tuple[List[str], List[str]]:
+    rq, group, next_rq = step
+    requests = parse_lines([rq] if next_rq is None else [rq, next_rq])
+    responses = parse_lines(group.split("\n"), skip_unused=True, skip_blocks=skipped_blocks(options))
+    return next(translator.translate_requests(idx + 1, requests, responses, start=idx))
+
+
+def convert_shared(test_cases: Iterable[Tuple[str, List[str]]], feed_dir: str, oracle_dir: str,
+                   options: Dict[str, object] = None) -> List[str]:
+    """translate test cases into feed_dir & oracle_dir, translating the request prefixes they share only once
+
+    The test cases are inserted in a trie of their steps. A depth-first walk translates every step once: the
+    translator reaching a node with several children is forked into a snapshot, from which each other child forks its
+    own translator, so every test case is translated as if by its own fresh Translator. A test case that is malformed
+    or fails is translated again on its own, so that its error is reported as by independent translation.
+    Returns the names of the failed test cases.
+    """
+    options = options or {}
+    root = Node()
+    fallback = {}
+    lines = {}
+    request_count = 0
+    for name, test_case in test_cases:
+        test_case_steps = steps(test_case)
+        if test_case_steps is None:
+            fallback[name] = test_case
+            continue
+        lines[name] = test_case
+        request_count += len(test_case_steps)
+        node = root
+        for step in test_case_steps:
+            node = node.children.setdefault(step, Node())
+        node.cases.append(name)
+
+    translated = 0
+    items = []
+    # (node, index of the step leading to it, step, translator to continue, or snapshot to fork it from)
+    fresh = Translator(**options)
+    stack = [(child, 0, step, None, fresh) for step, child in root.children.items()]
+    while stack:
+        node, idx, step, translator, snapshot = stack.pop()
+        if translator is None:
+            translator = snapshot.fork()
+        del items[idx:]
+        try:
+            items.append(_translate_step(translator, idx, step, options))
+        except Exception:
+            pending = [node]
+            while pending:
+                failed_node = pending.pop()
+                fallback.update((name, lines[name]) for name in failed_node.cases)
+                pending += failed_node.children.values()
+            continue
+        translated += 1
+
+        for name in node.cases:
+            print(name)
+            write_translation(translation_lines(items), path.join(feed_dir, name + ".mmtp"),
+                              path.join(oracle_dir, name + ".mmtp"))
+        children = list(node.children.items())
+        if len(children) > 1:
+            snapshot = translator.fork()
+            stack += [(child, idx + 1, child_step, None, snapshot) for child_step, child in children[:-1]]
+        if children:
+            child_step, child = children[-1]
+            stack.append((child, idx + 1, child_step, translator, None))
+
+    failed = []
+    for name in sorted(fallback):
+        print(name)
+        try:
+            convert_lines(fallback[name], path.join(feed_dir, name + ".mmtp"), path.join(oracle_dir, name + ".mmtp"),
+                          options=options)
+        except Exception as e:
+            print("%s: %s" % (name, format_error(e)), file=stderr)
+            failed.append(name)
+    print("shared prefixes: %d of %d requests translated" % (translated, request_count), file=stderr)
+    return failed
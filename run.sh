@@ -1,7 +1,7 @@
 #!/usr/bin/env bash
 
 if [ $# -ne 2 ]; then
-    echo -e "usage:\t$0 <mmtp_output_file> <actual_output_dir>"
+    echo -e "usage:\t[SUT=<command>] $0 <mmtp_output_file> <actual_output_dir>"
     exit 2
 fi
 FEED="$1"
@@ -13,11 +13,13 @@ if [[ $i == "n" ]]; then
     exit
 fi
 
-echo ""
-echo -e "\e[1m\e[33mPopulating ./raw...\e[39m\e[0m"
-rm -rf raw
-mkdir -p raw
-./splitter.py "$FEED" raw
+# with a SUT command line, translation, execution & comparison are pipelined
+if [ -n "$SUT" ]; then
+    echo ""
+    echo -e "\e[1m\e[33mRunning $SUT on ./feed & comparing ./oracle against $DIR...\e[39m\e[0m"
+    rm -rf feed oracle
+    exec ./harness.py --sut "$SUT" "$FEED" feed oracle "$DIR"
+fi
 
 echo ""
 echo -e "\e[1m\e[33mPopulating ./feed & ./oracle...\e[39m\e[0m"
@@ -25,7 +27,7 @@ rm -rf feed
 mkdir -p feed
 rm -rf oracle
 mkdir -p oracle
-./convert.sh
+./haskell2mmtp.py --suite "$FEED" feed oracle
 
 echo ""
 echo "Please run Java program to populate $DIR."
@@ -35,5 +37,5 @@ if [[ $i == "n" ]]; then
 fi
 
 echo ""
-echo -e "\e[1m\e[33mPopulating ./res...\e[39m\e[0m"
-./preprocess_test_suite.sh "$DIR"
+echo -e "\e[1m\e[33mComparing ./oracle against $DIR...\e[39m\e[0m"
+./compare.py "$DIR"
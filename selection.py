@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+
+import json
+from argparse import ArgumentParser
+from fnmatch import fnmatchcase
+from multiprocessing import Pool
+from os import cpu_count
+from sys import stderr
+from typing import Dict, List, Optional, Set, Tuple
+
+from haskell2mmtp import format_error, parse_lines, read_test_cases
+from layouts import LAYOUTS, columns
+from stats import Stats
+from translator import ORACLE, Translator
+
+# offset of the order status in an SLE-0172 confirmation
+STATUS_OFFSET = next(offset for offset, field in columns(LAYOUTS["0172"]) if field.name == "status")
+
+
+def features(test_case: List[str]) -> Tuple[int, Set[str]]:
+    """request count & behaviors a test case exercises, as the translator sees them
+
+    Features are the request types with their outcome, the emitted SLE messages, the order types & options (FAK, min
+    qty) of the incoming orders and the statuses of their confirmations.
+    """
+    test_case = list(filter(None, test_case))
+    request_count = int(test_case[0])
+    stats = Stats()
+    translator = stats.instrument(Translator())
+    res = set()
+
+    translate_incoming_order_cmd = translator.translate_incoming_order_cmd
+
+    def incoming_order_cmd(rq, rs, *args):
+        res.add("order %s" % rq.order_type)
+        if rq.fak:
+            res.add("order FAK")
+        if rq.min_qty:
+            res.add("order min qty")
+        return translate_incoming_order_cmd(rq, rs, *args)
+    translator.translate_incoming_order_cmd = incoming_order_cmd
+
+    translated = translator.translate_iter(request_count, parse_lines(test_case[1:], skip_unused=True))
+    for channel, line in stats.count_output(translated):
+        if channel == ORACLE and line[16:20] == "0172" and line[STATUS_OFFSET] != " ":
+            res.add("status %s" % line[STATUS_OFFSET])
+    res.update("request %s" % request for request in stats.requests)
+    res.update("sle %s" % sle for sle in stats.sle)
+    return request_count, res
+
+
+def _features(job: Tuple[str, List[str]]) -> Tuple[str, int, Set[str], Optional[str]]:
+    """pool worker: features of a test case, with the failure message if any"""
+    name, test_case = job
+    try:
+        request_count, test_case_features = features(test_case)
+    except Exception as e:
+        return name, 0, set(), format_error(e)
+    return name, request_count, test_case_features, None
+
+
+def select(coverage: Dict[str, Set[str]], costs: Dict[str, int], wanted: Set[str]) -> List[str]:
+    """greedy set cover: test cases covering the wanted features, each adding the most features not covered yet
+
+    Ties go to the cheapest test case (fewest requests, so the shortest SUT run), then to the first by name.
+    """
+    uncovered = set(wanted)
+    res = []
+    while uncovered:
+        name = min(coverage, key=lambda case: (-len(coverage[case] & uncovered), costs[case], case))
+        if not coverage[name] & uncovered:
+            break
+        res.append(name)
+        uncovered -= coverage[name]
+    return sorted(res)
+
+
+def load_manifest(manifest_path: str) -> Set[str]:
+    """names of the test cases selected by a manifest"""
+    with open(manifest_path) as f:
+        return set(json.load(f)["test_cases"])
+
+
+def main():
+    parser = ArgumentParser(
+        usage="\t%(prog)s [--batch | --archive] [--range START:STOP] [--feature PATTERN ...] [--jobs N] "
+              "<input.mmtp | raw_dir | archive> <manifest.json>",
+        description="select a near-minimal subset of test cases covering every feature (request outcomes, SLE "
+                    "messages, order types & options, confirmation statuses) exercised by the suite")
+    parser.add_argument("src")
+    parser.add_argument("manifest")
+    parser.add_argument("--batch", action="store_true", help="read the test cases of a splitter.py directory")
+    parser.add_argument("--archive", action="store_true", help="read the test cases of a splitter.py archive")
+    parser.add_argument("--range", metavar="START:STOP",
+                        help="only select among these test cases (0-based indices in test case order, STOP excluded)")
+    parser.add_argument("--feature", metavar="PATTERN", action="append",
+                        help="only cover the features matching this shell-style pattern, e.g. 'request *Rejected' "
+                             "(repeatable, default: every feature)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: cpu count)")
+    args = parser.parse_args()
+
+    coverage, costs = {}, {}
+    with Pool(args.jobs or cpu_count()) as pool:
+        test_cases = read_test_cases(args.src, args.batch, args.archive, args.range)
+        for name, request_count, test_case_features, error in pool.imap(_features, test_cases, chunksize=8):
+            if error:
+                print("%s: %s, not selectable" % (name, error), file=stderr)
+                continue
+            coverage[name] = test_case_features
+            costs[name] = request_count
+
+    exercised = set().union(*coverage.values())
+    wanted = {feature for feature in exercised
+              if args.feature is None or any(fnmatchcase(feature, pattern) for pattern in args.feature)}
+    for pattern in args.feature or []:
+        if not any(fnmatchcase(feature, pattern) for feature in exercised):
+            print("no test case exercises %s" % pattern, file=stderr)
+    selected = select(coverage, costs, wanted)
+
+    manifest = {
+        "test_cases": selected,
+        "requests": sum(costs[name] for name in selected),
+        "coverage": {
+            feature: next(name for name in selected if feature in coverage[name]) for feature in sorted(wanted)
+        },
+    }
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print("%d of %d test case(s) selected, %d of %d requests, covering %d feature(s)" % (
+        len(selected), len(coverage), manifest["requests"], sum(costs.values()), len(wanted)))
+
+
+if __name__ == '__main__':
+    main()
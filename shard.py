@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+
+import json
+from argparse import ArgumentParser
+from heapq import merge
+from multiprocessing import Pool
+from operator import itemgetter
+from os import cpu_count
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from haskell2mmtp import parse_lines, skipped_blocks, write_translation
+from layouts import LAYOUTS, columns
+from translator import Translator, translation_lines
+
+# (offset, width, whether a trade number rather than a HON) of the fields each shard numbers on its own, by SLE message
+NUMBERED_FIELDS = {
+    code: [(offset, field.width, field.name == "trade number") for offset, field in columns(layout)
+           if field.name in {"HON", "original HON", "trade number"}]
+    for code, layout in LAYOUTS.items()
+}
+
+
+class Shard:
+    """Haskell trace of a single security, cut out of a multi-security trace
+
+    `indices` are the global indices of its requests, `requests` & `responses` their stripped lines.
+    """
+    __slots__ = ("security_id", "indices", "requests", "responses")
+
+    def __init__(self, security_id: str):
+        self.security_id = security_id
+        self.indices = []
+        self.requests = []
+        self.responses = []
+
+
+def split_securities(lines: Iterable[str]) -> Tuple[int, Dict[str, Shard]]:
+    """split the stripped lines of a multi-security haskell trace into per security shards, in order of appearance
+
+    A multi-security trace is a haskell trace whose request lines are prefixed with a security id column. Its
+    response groups are in request order, so each one goes to the security of its request.
+    Returns the request count & the shards.
+    """
+    lines = enumerate(filter(None, lines), 1)
+    _, request_count = next(lines, (0, None))
+    assert request_count is not None, "empty haskell output"
+    request_count = int(request_count)
+
+    shards = {}
+    securities = []
+    for idx in range(request_count):
+        line, rq = next(lines, (None, None))
+        assert rq is not None, "missing request, %d declared" % request_count
+        security_id, sep, rq = rq.partition("\t")
+        assert sep and rq, "line %d request should be prefixed with a security id" % line
+        shard = shards.get(security_id)
+        if shard is None:
+            shard = shards[security_id] = Shard(security_id)
+        shard.indices.append(idx)
+        shard.requests.append(rq)
+        securities.append(shard)
+
+    idx = -1
+    for line, rs in lines:
+        if rs.split("\t", 1)[0].endswith("Rs"):
+            idx += 1
+            assert idx < request_count, "line %d response without request, %d declared" % (line, request_count)
+        assert idx >= 0, "line %d response group should start with a response" % line
+        securities[idx].responses.append(rs)
+    assert idx + 1 == request_count, "missing response, %d requests but %d responses" % (request_count, idx + 1)
+    return request_count, shards
+
+
+def translate_shard(job: Tuple[Shard, Dict[str, object]]) -> List[Tuple[int, str, List[str], List[str], int, int]]:
+    """pool worker: translate a shard with its own Translator
+
+    Returns (global index, security id, feed, results, HONs assigned, trades numbered so far) per request.
+    """
+    shard, options = job
+    translator = Translator(security_id=shard.security_id, multi_security=True, **options)
+    translated = translator.translate_requests(
+        len(shard.requests), parse_lines(shard.requests),
+        parse_lines(shard.responses, skip_unused=True, skip_blocks=skipped_blocks(options)))
+    return [
+        (idx, shard.security_id, feed, results, translator.order_cnt, translator.trade_cnt)
+        for idx, (feed, results) in zip(shard.indices, translated)
+    ]
+
+
+def renumber(line: str, hons: List[int], trades: List[int]) -> str:
+    """replace the HONs & trade numbers of a shard in an SLE message by their global numbers"""
+    for offset, width, trade in NUMBERED_FIELDS.get(line[16:20], ()):
+        number = int(line[offset:offset + width])
+        if number:
+            line = "%s%0*d%s" % (line[:offset], width, (trades if trade else hons)[number - 1], line[offset + width:])
+    return line
+
+
+def translate_sharded(lines: Iterable[str], config: Dict[str, Dict[str, object]] = None, jobs: int = None,
+                      options: Dict[str, object] = None) -> Iterator[Tuple[str, str]]:
+    """translate a multi-security trace, one security per worker, into (channel, line) pairs in request order
+
+    Every security has its own Translator, configured with the common `options` & its `config` entry (cisin, group,
+    reference price, ...). Each shard numbers its HONs & trades from 1: the merge renumbers them in global request
+    order, as a single engine would, so they are unique across securities and do not depend on how the shards are
+    scheduled.
+    """
+    _, shards = split_securities(lines)
+    config = config or {}
+    for security_id, security_config in config.items():
+        assert "security_id" not in security_config, \
+            "security %s config should not set security_id, the trace does" % security_id
+    batch = [(shard, dict(options or {}, **config.get(security_id, {}))) for security_id, shard in shards.items()]
+    translated = []
+    if batch:
+        with Pool(min(len(batch), jobs or cpu_count())) as pool:
+            translated = pool.map(translate_shard, batch, chunksize=1)
+
+    # global numbers of the HONs & trades of each security, indexed by their shard number - 1, & the last ones given
+    hons = {security_id: [] for security_id in shards}
+    trades = {security_id: [] for security_id in shards}
+    numbered = [0, 0]
+
+    def renumbered() -> Iterator[Tuple[List[str], List[str]]]:
+        for _, security_id, feed, results, order_cnt, trade_cnt in merge(*translated, key=itemgetter(0)):
+            for numbers, count, kind in ((hons[security_id], order_cnt, 0), (trades[security_id], trade_cnt, 1)):
+                while len(numbers) < count:
+                    numbered[kind] += 1
+                    numbers.append(numbered[kind])
+            yield (
+                [renumber(line, hons[security_id], trades[security_id]) for line in feed],
+                [renumber(line, hons[security_id], trades[security_id]) for line in results],
+            )
+
+    yield from translation_lines(renumbered())
+
+
+def main():
+    parser = ArgumentParser(
+        usage="\t%(prog)s [--jobs N] [--securities FILE] [--compact-feed] <haskell_output> <feed.mmtp> <oracle.mmtp>")
+    parser.add_argument("haskell_output", help="haskell output whose request lines are prefixed with a security id")
+    parser.add_argument("feed")
+    parser.add_argument("oracle")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument("--securities", metavar="FILE",
+                        help="JSON object of the Translator options (cisin, group, ...) of each security id")
+    parser.add_argument("--compact-feed", action="store_true",
+                        help="merge consecutive price band setters into a single price band cycle of the feed")
+    args = parser.parse_args()
+
+    config = None
+    if args.securities:
+        with open(args.securities) as f:
+            config = json.load(f)
+    with open(args.haskell_output) as f:
+        translation = translate_sharded(map(str.strip, f), config, args.jobs, {"compact_feed": args.compact_feed})
+        write_translation(translation, args.feed, args.oracle)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,22 +4,48 @@ from sys import argv, stderr
 from itertools import groupby
 from os import path
 from operator import itemgetter
+from typing import Iterable, Iterator, List
+
+
+def test_case_name(idx: int) -> str:
+    """name of the idx-th (0-based) test case of a test suite"""
+    return "testcase%03d" % (idx+1)
+
+
+def test_case_index(name: str) -> int:
+    """0-based index of a test case from its name, the inverse of test_case_name"""
+    assert name.startswith("testcase") and name[len("testcase"):].isdigit(), "%s is not a test case name" % name
+    return int(name[len("testcase"):]) - 1
+
+
+def split_test_cases(src: Iterable[str]) -> Iterator[List[str]]:
+    """lazily split the body of a test suite into the stripped lines of each test case
+
+    Test cases are separated by blank lines; only one test case is held in memory at a time.
+    """
+    test_cases = groupby(map(str.strip, src), lambda line: line != "")
+    test_cases = filter(itemgetter(0), test_cases)
+    test_cases = map(itemgetter(1), test_cases)
+    return map(list, test_cases)
 
 
 def main():
+    if len(argv) == 4 and argv[1] == "--archive":
+        from archive import pack
+        with open(argv[2]) as src:
+            print("%s: %d test cases" % (argv[3], pack(src, argv[3])))
+        return
     if len(argv) != 3:
-        print("usage:\t%s <input.mmtp> <output_dir>" % argv[0], file=stderr)
+        print("usage:\t%s <input.mmtp> <output_dir>\n\t%s --archive <input.mmtp> <output.archive>" % (argv[0], argv[0]),
+              file=stderr)
         exit(2)
 
     with open(argv[1]) as src:
         test_suite_size = int(next(src))
-        test_cases = groupby(map(str.strip, src), lambda line: line != "")
-        test_cases = filter(itemgetter(0), test_cases)
-        test_cases = map(itemgetter(1), test_cases)
-        test_cases = map("\n".join, test_cases)
+        test_cases = map("\n".join, split_test_cases(src))
 
         for idx, test_caes in enumerate(test_cases):
-            name = "testcase%03d" % (idx+1)
+            name = test_case_name(idx)
             print(name)
             with open(path.join(argv[2], name), "w") as dst:
                 print(test_caes, file=dst)
@@ -0,0 +1,228 @@
+import json
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from cProfile import Profile
+from functools import wraps
+from sys import getsizeof
+from time import perf_counter
+from typing import Callable, DefaultDict, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from translator import FEED, Translator
+
+# translator methods timed by Stats.instrument, by stage
+STAGES = {
+    "read_state": ["_read_state", "_read_trades"],
+    "order_book": ["update_order_book_view_by_order", "update_order_book_view_by_cancel_order",
+                   "update_order_book_view_by_trade", "settle_order_book_view", "check_order_book_view"],
+    "encode": ["translate_order", "translate_cancel_order", "translate_rejection_msg", "translate_confirmation_msg",
+               "translate_execution_notice", "get_price_band_cmds"],
+}
+
+
+class Stats:
+    """Hot path instrumentation of conversions
+
+    Wall time is accumulated per stage, exclusive of the nested stages (e.g. "translate" excludes the "encode" time
+    of the SLE encoders it calls). Nothing is instrumented unless `instrument` is called on a translator, so the
+    translator pays nothing when statistics are off.
+    """
+    seconds: DefaultDict[str, float]
+    calls: Counter
+    requests: Counter
+    sle: Counter
+    max_order_book_depth: int
+    memory: Counter
+    test_cases: int
+    _stack: List[List]
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = Counter()
+        self.requests = Counter()
+        self.sle = Counter()
+        self.max_order_book_depth = 0
+        self.memory = Counter()
+        self.test_cases = 0
+        self._stack = []
+
+    def _enter(self, stage: str) -> None:
+        self._stack.append([stage, perf_counter(), 0.0])
+
+    def _exit(self) -> None:
+        stage, begin, nested = self._stack.pop()
+        elapsed = perf_counter() - begin
+        self.seconds[stage] += elapsed - nested
+        self.calls[stage] += 1
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    @contextmanager
+    def timer(self, stage: str):
+        self._enter(stage)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def timed(self, stage: str, func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            self._enter(stage)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._exit()
+        return wrapper
+
+    def timed_iter(self, stage: str, iterable: Iterable) -> Iterator:
+        """time every step of a lazy iterable"""
+        iterator = iter(iterable)
+        while True:
+            self._enter(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            yield item
+
+    def instrument(self, translator: Translator) -> Translator:
+        """time the hot paths of a translator and count its requests, outcomes & order book depth"""
+        for stage, methods in STAGES.items():
+            for method in methods:
+                setattr(translator, method, self.timed(stage, getattr(translator, method)))
+
+        settle = translator.settle_order_book_view
+
+        def settle_order_book_view(*args, **kwargs):
+            settle(*args, **kwargs)
+            self.max_order_book_depth = max(self.max_order_book_depth, len(translator.remaining_qty))
+        translator.settle_order_book_view = settle_order_book_view
+
+        translate_admin_cmd = self.timed("translate", translator.translate_admin_cmd)
+        translate_incoming_order_cmd = self.timed("translate", translator.translate_incoming_order_cmd)
+        translate_cancel_order_cmd = self.timed("translate", translator.translate_cancel_order_cmd)
+
+        def admin_cmd(rq, *args):
+            self.requests[rq[0]] += 1
+            return translate_admin_cmd(rq, *args)
+
+        def incoming_order_cmd(rq, rs, *args):
+            self.requests["%s %s" % (rq.order_request_type, rs[1])] += 1
+            return translate_incoming_order_cmd(rq, rs, *args)
+
+        def cancel_order_cmd(rq, rs, *args):
+            self.requests["%s %s" % (rq.order_request_type, rs[1])] += 1
+            return translate_cancel_order_cmd(rq, rs, *args)
+
+        translator.translate_admin_cmd = admin_cmd
+        translator.translate_incoming_order_cmd = incoming_order_cmd
+        translator.translate_cancel_order_cmd = cancel_order_cmd
+
+        if translator.bounded_memory:
+            evict_terminal_orders = translator.evict_terminal_orders
+
+            def evict(order_ids):
+                order_ids = list(order_ids)
+                evicted = [order_id for order_id in dict.fromkeys(order_ids)
+                           if order_id not in translator.remaining_qty and order_id in translator.sequence_nums]
+                self.memory["saved_bytes"] += orders_footprint(
+                    [translator.orders.get(order_id) for order_id in evicted],
+                    [translator.sequence_nums[order_id] for order_id in evicted])
+                evict_terminal_orders(order_ids)
+            translator.evict_terminal_orders = evict
+        return translator
+
+    def count_memory(self, translator: Translator) -> None:
+        """account for the orders a bounded memory translator evicted & the memory it saved
+
+        The saved bytes are the footprint of the evicted orders plus the growth of the order & HON maps that keeping
+        them would have cost, minus the tombstones still kept (with the ids & HONs they hold) and their map.
+        """
+        if translator.bounded_memory:
+            self.memory.update(evicted_orders=translator.evicted_orders, tombstones=len(translator.tombstones))
+            for kept in (translator.orders, translator.sequence_nums):
+                self.memory["saved_bytes"] += dict_size(len(kept) + translator.evicted_orders) - getsizeof(kept)
+            self.memory["saved_bytes"] -= getsizeof(translator.tombstones) + sum(
+                getsizeof(tombstone) + number_size(order_id) + number_size(tombstone[0])
+                for order_id, tombstone in translator.tombstones.items())
+
+    def count_output(self, translation: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        """count the emitted SLE messages per channel & function code, admin commands being counted as such"""
+        for channel, line in translation:
+            code = line[16:20] if channel != FEED or not line.startswith(("{", "SET ")) else "admin"
+            self.sle["%s %s" % (channel, code)] += 1
+            yield channel, line
+
+    def merge(self, other: Dict[str, object]) -> None:
+        """accumulate the report of another run, e.g. of a pool worker"""
+        for stage, seconds in other["seconds"].items():
+            self.seconds[stage] += seconds
+        self.calls.update(other["calls"])
+        self.requests.update(other["requests"])
+        self.sle.update(other["sle"])
+        self.max_order_book_depth = max(self.max_order_book_depth, other["max_order_book_depth"])
+        self.memory.update(other.get("bounded_memory", {}))
+        self.test_cases += other["test_cases"]
+
+    def report(self) -> Dict[str, object]:
+        res = {
+            "test_cases": self.test_cases,
+            "seconds": dict(sorted(self.seconds.items())),
+            "calls": dict(sorted(self.calls.items())),
+            "requests": dict(sorted(self.requests.items())),
+            "sle": dict(sorted(self.sle.items())),
+            "max_order_book_depth": self.max_order_book_depth,
+        }
+        if self.memory:
+            res["bounded_memory"] = dict(sorted(self.memory.items()))
+        return res
+
+    def dump(self, stats_path: str) -> None:
+        with open(stats_path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+def orders_footprint(orders: Iterable[Optional[object]], hons: Iterable[int]) -> int:
+    """bytes freed by dropping orders & their HONs: the orders themselves & the numbers they alone hold
+
+    Brokers are words kept by the tombstones, and old ids are the ids of other orders. A number shared by two of the
+    orders (e.g. the price of a cancel request, copied from its original order) is counted once.
+    """
+    size = 0
+    numbers = {id(hon): hon for hon in hons}
+    for order in orders:
+        if order is None:
+            continue
+        size += getsizeof(order)
+        for field in order.__slots__:
+            value = getattr(order, field)
+            if field not in ("old_id", "broker"):
+                numbers[id(value)] = value
+    return size + sum(number_size(value) for value in numbers.values())
+
+
+def number_size(value: object) -> int:
+    """size of a number object of its own, 0 for words & the small ints all share"""
+    return getsizeof(value) if type(value) in (int, float) and not -5 <= value <= 256 else 0
+
+
+def dict_size(length: int) -> int:
+    """size of a dict grown to the given length"""
+    return getsizeof(dict.fromkeys(range(length)))
+
+
+@contextmanager
+def profiled(profile_path: Optional[str]):
+    """run the enclosed block under cProfile, dumping the profile to profile_path (no-op without a path)"""
+    if profile_path is None:
+        yield
+        return
+    profile = Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(profile_path)
@@ -1,13 +1,61 @@
 import json
-from collections import defaultdict
-from copy import deepcopy
+from collections import ChainMap, OrderedDict
+from copy import copy
 from dataclasses import dataclass
-from typing import List, Tuple, Dict, DefaultDict
+from itertools import chain, islice
+from math import isfinite
+from typing import List, Tuple, Dict, Iterable, Iterator, Mapping, Optional, Set
+
+from layouts import SLE_0001_0002, SLE_0003, SLE_0105, SLE_0144, SLE_0172, compile_layout
+
+SIDES = {"BUY": "A", "SELL": "V", "CROSS": "2"}
+ORDER_TYPES = {"Limit": "L", "Iceberg": "L"}
+VALIDITY_TYPES = {True: "E", False: "J"}
+FUNCTION_CODES = {"NewOrderRq": "0001", "ReplaceOrderRq": "0002", "CancelOrderRq": "0003"}
+# security state reported after the order book, credits & ownerships of every order response
+STATE_MSGS = ["ReferencePrice", "StaticPriceBandLowerLimit", "StaticPriceBandUpperLimit", "TotalShares",
+              "OwnershipUpperLimit", "TickSize", "LotSize"]
+
+# admin requests each translated into a whole price band cycle of the security
+PRICE_BAND_RQS = {"SetReferencePriceRq", "SetStaticPriceBandUpperLimitRq", "SetStaticPriceBandLowerLimitRq"}
+
+# translator state carried from a request to the next (price band settings included), saved by checkpoints
+CHECKPOINT_STATE = ("trade_cnt", "order_cnt", "orders", "remaining_qty", "sequence_nums", "eliminated", "tombstones",
+                    "evicted_orders", "order_requests", "reference_price", "lower_bound_percentage",
+                    "upper_bound_percentage")
+FEED = "feed"
+ORACLE = "oracle"
+
+
+def _json_number(value: float) -> str:
+    """json.dumps of a number, without its overhead for finite ones"""
+    return repr(value) if isfinite(value) else json.dumps(value)
+
+
+def translation_lines(translated: Iterable[Tuple[List[str], List[str]]], resumed: bool = False) -> \
+        Iterator[Tuple[str, str]]:
+    """frame translated (feed, result) lines of each request into the (channel, line) pairs of a whole session
+
+    A session `resumed` from a checkpoint has already been opened.
+    """
+    if not resumed:
+        yield FEED, json.dumps({"command": "Change System State", "targetState": "TRADING_SESSION"})
+        yield FEED, json.dumps({"timestamp": "08:30:00.000000000"})
+    for feed, results in translated:
+        for line in feed:
+            if line:
+                yield FEED, line
+        for line in results:
+            if line:
+                yield ORACLE, line
+    # yield FEED, json.dumps({"command": "End Session"})
+    yield FEED, json.dumps({"command": "Shutdown"})
 
 
 @dataclass
 class Trade:
     """Trade DTO"""
+    __slots__ = ("price", "qty", "buy_id", "sell_id")
     price: float
     qty: int
     buy_id: str
@@ -17,6 +65,8 @@ class Trade:
 @dataclass
 class OrderRq:
     """Order Request DTO"""
+    __slots__ = ("order_request_type", "old_id", "order_type", "id", "broker", "shareholder", "price", "qty", "side",
+                 "min_qty", "fak", "disclodes_qty")
     order_request_type: str
     old_id: str
     order_type: str
@@ -45,10 +95,18 @@ class Translator:
     trade_cnt: int
     order_cnt: int
     orders: Dict[str, object]
-    remaining_qty: DefaultDict[str, int]
-    previous_remaining_qty: DefaultDict[str, int]
+    remaining_qty: Dict[str, int]
+    previous_remaining_qty: Mapping[str, int]
     sequence_nums: Dict[str, int]
-    eliminated: Dict[str, bool]
+    eliminated: Set[str]
+    bounded_memory: bool
+    max_tombstones: Optional[int]
+    tombstones: Dict[str, Tuple[int, str]]
+    evicted_orders: int
+    compact_feed: bool
+    check_every: int
+    multi_security: bool
+    order_requests: int
 
     def __init__(
             self,
@@ -61,6 +119,11 @@ class Translator:
             lower_bound_percentage: float = 0.9,
             upper_bound_percentage: float = 0.9,
             src_shareholder_id: str = "1000",
+            bounded_memory: bool = False,
+            max_tombstones: int = None,
+            compact_feed: bool = False,
+            check_every: int = 1,
+            multi_security: bool = False,
     ):
         self.security_id = security_id
         self.cisin = cisin
@@ -74,15 +137,80 @@ class Translator:
         self.trade_cnt = 0
         self.order_cnt = 0
         self.orders = {}
-        self.remaining_qty = defaultdict(int)
-        self.previous_remaining_qty = defaultdict(int)
+        self.remaining_qty = {}
+        self.previous_remaining_qty = {}
         self.sequence_nums = {}
-        self.eliminated = {}
-
-    @staticmethod
-    def translate_price_to_mmtp(price: float) -> str:
-        """translate price to IFt-QMt9 MMTP format"""
-        return "2" + "%07d" % int(price) + "00"  # FIXME
+        self.eliminated = set()
+        self.bounded_memory = bounded_memory
+        self.max_tombstones = max_tombstones
+        self.tombstones = OrderedDict()
+        self.evicted_orders = 0
+        self.compact_feed = compact_feed
+        assert check_every is None or check_every >= 0, "check_every must be 0 or more, got %d" % check_every
+        self.check_every = check_every or 0
+        self.multi_security = multi_security
+        self.order_requests = 0
+        self._compile_layouts()
+        self._compile_admin_templates()
+
+    def _compile_layouts(self) -> None:
+        """precompile the SLE encoders, folding the configuration constants in"""
+        constants = {
+            "date": self.date,
+            "time": self.time,
+            "security_id": self.security_id,
+            "group": self.group,
+            "timestamp": "%s%s" % (self.date, self.time),
+        }
+        self._order_formats = {
+            rq_type: compile_layout(SLE_0001_0002, function_code=function_code, **constants)
+            for rq_type, function_code in [("NewOrderRq", "0001"), ("ReplaceOrderRq", "0002"), (None, "0000")]
+        }
+        self._cancel_formats = {
+            rq_type: compile_layout(SLE_0003, function_code=function_code, **constants)
+            for rq_type, function_code in [("CancelOrderRq", "0003"), (None, "0000")]
+        }
+        self._rejection_format = compile_layout(SLE_0144, **constants)
+        self._confirmation_formats = {
+            rq_type: compile_layout(SLE_0172, function_code=function_code, original_date=original_date,
+                                    validity_date=validity_date, **constants)
+            for rq_type, function_code, original_date, validity_date in [
+                ("NewOrderRq", "0001", "%08d" % 0, "%08d" % 0),
+                ("ReplaceOrderRq", "0002", self.date, "%08d" % 0),
+                ("CancelOrderRq", "0003", "%08d" % 0, self.date),
+                (None, "0000", "%08d" % 0, "%08d" % 0),
+            ]
+        }
+        self._execution_notice_format = compile_layout(SLE_0105, **constants)
+
+    def _compile_admin_templates(self) -> None:
+        """pre-serialize the price band cycle commands, leaving printf-style slots for the band & reference price"""
+        def security_state_cmd(target_state: str) -> str:
+            return json.dumps({
+                "command": "Change Security State",
+                "items": [self.security_id],
+                "groupName": None,
+                "targetState": target_state
+            })
+
+        slots = ["\0upper", "\0lower", "\0reference"]
+        price_band_format = json.dumps({
+            "command": "Change Security Static Price Band",
+            "items": [self.security_id],
+            "priceBandPercentage":
+                {"upperBound": slots[0],
+                 "lowerBound": slots[1]},
+            "referencePrice": slots[2],
+            "groupCode": None
+        }).replace("%", "%%")
+        for slot in slots:
+            price_band_format = price_band_format.replace(json.dumps(slot), "%s")
+        self._price_band_format = price_band_format
+        self._surveillance_cmd = security_state_cmd("SURVEILLANCE")
+        self._reserved_cmd = security_state_cmd("RESERVED")
+        self._opened_cmd = security_state_cmd("OPENED")
+        # admin commands of a multi-security session name the security they apply to
+        self._admin_scope = "security=%s " % self.security_id if self.multi_security else ""
 
     def translate_admin_cmd(self, rq: List[object]) -> Tuple[List[str], List[str]]:
         if rq[0] == "SetReferencePriceRq":
@@ -123,7 +251,10 @@ class Translator:
         self.order_cnt += 1
         self.sequence_nums[rq.id] = self.order_cnt
         self.remaining_qty[rq.id] = rq.qty if not eliminated else 0
-        self.eliminated[rq.id] = eliminated
+        if eliminated:
+            self.eliminated.add(rq.id)
+        else:
+            self.eliminated.discard(rq.id)
 
     def update_order_book_view_by_cancel_order(self, rq: OrderRq) -> None:
         assert rq.order_request_type == "CancelOrderRq", "Invalid order request type"
@@ -132,23 +263,88 @@ class Translator:
 
         self.orders[rq.id] = rq
         self.sequence_nums[rq.id] = self.sequence_nums[rq.old_id]
-        self.remaining_qty[rq.id] = self.remaining_qty[rq.old_id]
+        self.remaining_qty[rq.id] = self.remaining_qty.get(rq.old_id, 0)
 
     def update_order_book_view_by_trade(self, trade: Trade) -> None:
-        assert trade.qty <= self.remaining_qty[trade.buy_id] and trade.qty <= self.remaining_qty[
-            trade.sell_id], "not enough qty in order book view"
+        assert trade.qty <= self.remaining_qty.get(trade.buy_id, 0) and trade.qty <= self.remaining_qty.get(
+            trade.sell_id, 0), "not enough qty in order book view"
 
         self.trade_cnt += 1
-        self.remaining_qty[trade.buy_id] -= trade.qty
-        self.remaining_qty[trade.sell_id] -= trade.qty
-
-    def regenerate_order_book(self, orderbook: [OrderRq]):
-        self.previous_remaining_qty = self.remaining_qty
-        self.remaining_qty = defaultdict(int)
-        for queued_order in orderbook:
-            self.remaining_qty[queued_order.id] = queued_order.qty
+        self.remaining_qty[trade.buy_id] = self.remaining_qty.get(trade.buy_id, 0) - trade.qty
+        self.remaining_qty[trade.sell_id] = self.remaining_qty.get(trade.sell_id, 0) - trade.qty
+
+    def evict_terminal_orders(self, order_ids: Iterable[str]) -> None:
+        """move the given orders out of the translator state once they left the order book (bounded memory mode)
+
+        An order out of the book can only be referenced again by requests the engine rejects, whose translation only
+        needs its HON & broker: that is all its tombstone keeps. Past `max_tombstones`, the oldest tombstones are
+        forgotten too, and a late reference to them is translated as a reference to an unknown order.
+        """
+        for order_id in order_ids:
+            if order_id in self.remaining_qty or order_id not in self.sequence_nums:
+                continue
+            order = self.orders.pop(order_id, None)
+            tombstone = (self.sequence_nums.pop(order_id), order.broker if order is not None else None)
+            self.eliminated.discard(order_id)
+            self.tombstones[order_id] = tombstone
+            self.evicted_orders += 1
+            if self.max_tombstones is not None and len(self.tombstones) > self.max_tombstones:
+                self.tombstones.popitem(last=False)
+
+    def _hon(self, order_id: str) -> int:
+        """HON of a live or evicted order, 0 if unknown"""
+        hon = self.sequence_nums.get(order_id)
+        if hon is None:
+            hon = self.tombstones.get(order_id, (0, None))[0]
+        return hon
+
+    def settle_order_book_view(self, rq: OrderRq, trades: List[Trade]) -> None:
+        """apply the end of an accepted request to the order book view
+
+        Only the orders touched by the request are updated: a replaced or cancelled order leaves the book, so does the
+        unmatched part of a FAK order, and fully traded orders are dropped. `previous_remaining_qty` keeps the view as
+        it was before settling, by recording only the changed orders in front of `remaining_qty`.
+        """
+        previous = {}
+
+        def settle(order_id: str, qty: int) -> None:
+            if order_id not in previous:
+                previous[order_id] = self.remaining_qty.get(order_id, 0)
+            if qty:
+                self.remaining_qty[order_id] = qty
+            else:
+                self.remaining_qty.pop(order_id, None)
 
-    def translate_incoming_order_cmd(self, rq: OrderRq, rs: List[object], trades: List[Trade], orderbook: [OrderRq]) -> \
+        touched = [rq.id]
+        if rq.order_request_type == "CancelOrderRq":
+            settle(rq.old_id, 0)
+            settle(rq.id, 0)
+        elif rq.order_request_type == "ReplaceOrderRq" and rq.id not in self.eliminated:
+            settle(rq.old_id, 0)
+        if rq.fak:
+            settle(rq.id, 0)
+        for trade in trades:
+            touched += [trade.buy_id, trade.sell_id]
+        for order_id in touched:
+            if not self.remaining_qty.get(order_id, 0):
+                settle(order_id, 0)
+
+        self.previous_remaining_qty = ChainMap(previous, self.remaining_qty)
+
+    def check_order_book_view(self, line: int, orderbook: Dict[str, int]) -> None:
+        """assert that the order book view matches the haskell snapshot declared at `line`, reporting the first
+        diverging order"""
+        if self.remaining_qty == orderbook:
+            return
+        for offset, (order_id, qty) in enumerate(orderbook.items(), 1):
+            view_qty = self.remaining_qty.get(order_id, 0)
+            assert view_qty == qty, "line %d order %s remaining qty is %d but %d in the order book view" % (
+                line + offset, order_id, qty, view_qty)
+        order_id = next(order_id for order_id in self.remaining_qty if order_id not in orderbook)
+        raise AssertionError("line %d order %s is missing from the order book, but has a remaining qty of %d in the "
+                             "order book view" % (line, order_id, self.remaining_qty[order_id]))
+
+    def translate_incoming_order_cmd(self, rq: OrderRq, rs: List[object], trades: List[Trade]) -> \
             Tuple[str, List[str]]:
         order = self.translate_order(rq)
         # print(asdict(rq))
@@ -162,7 +358,7 @@ class Translator:
                 traded_qty_on_entry += trade.qty
                 translated_trades += self.translate_trade(trade)
 
-            self.regenerate_order_book(orderbook)
+            self.settle_order_book_view(rq, trades)
 
             result = self.translate_confirmation_msg(rq, traded_qty_on_entry)
         else:
@@ -170,150 +366,180 @@ class Translator:
             assert not trades, "trades on rejected order %s" % rq.id
         return order, [result] + translated_trades
 
-    def translate_cancel_order_cmd(self, rq: OrderRq, rs: List[object], orderbook: [OrderRq]) -> Tuple[str, str]:
-        if rq.old_id in self.orders:
-            new_rq = deepcopy(self.orders[rq.old_id])
-            new_rq.order_request_type = rq.order_request_type
-            new_rq.old_id = rq.old_id
-            new_rq.id = rq.id
-            new_rq.side = rq.side
-            rq = new_rq
+    def translate_cancel_order_cmd(self, rq: OrderRq, rs: List[object]) -> Tuple[str, str]:
+        original = self.orders.get(rq.old_id)
+        if original is not None:
+            # the cancel request only carries ids & side, the rest refers to the original order
+            rq = OrderRq(rq.order_request_type, rq.old_id, original.order_type, rq.id, original.broker,
+                         original.shareholder, original.price, original.qty, rq.side, original.min_qty, original.fak,
+                         original.disclodes_qty)
+        elif rq.old_id in self.tombstones:
+            # an evicted order can only be cancelled in vain, its broker is all its cancel request needs
+            rq.broker = self.tombstones[rq.old_id][1]
 
         order = self.translate_cancel_order(rq)
         # print(asdict(rq))
         if rs[1] in {"Accepted", "Eliminated"}:
             self.update_order_book_view_by_cancel_order(rq)
 
-            self.regenerate_order_book(orderbook)
+            self.settle_order_book_view(rq, [])
 
             result = self.translate_confirmation_msg(rq)
         else:
             result = self.translate_rejection_msg(rq)
         return order, result
 
-    def _read_state(self, haskell_res: List[List[object]], rs_idx: int, request_count: int):
-        orderbook_count_msg = haskell_res[rs_idx]
-        rs_idx += 1
-        assert orderbook_count_msg[0] == "Orders", "line " + str(
-            rs_idx + request_count + 2) + " OrderBooks length should be declared after OrderRq but " + \
-                                                   orderbook_count_msg[0]
-        orderbook_count = orderbook_count_msg[1]
-        orderbook = haskell_res[rs_idx: rs_idx + orderbook_count]
-        orderbook = list(map(lambda order: OrderRq(None, None, *order[1:]), orderbook))
-        rs_idx += orderbook_count
-
-        credits_count_msg = haskell_res[rs_idx]
-        rs_idx += 1
-        assert credits_count_msg[0] == "Credits", "line " + str(
-            rs_idx + request_count + 2) + " Credits count should be declared after OrderRq but " + credits_count_msg[0]
-        credits_count = credits_count_msg[1]
-        rs_idx += credits_count
-
-        ownerships_count_msg = haskell_res[rs_idx]
-        rs_idx += 1
-        assert ownerships_count_msg[0] == "Ownerships", "line " + str(
-            rs_idx + request_count + 2) + " Ownerships count should be declared after OrderRq but " + \
-                                                        ownerships_count_msg[0]
-        ownerships_count = ownerships_count_msg[1]
-        rs_idx += ownerships_count
-
-        reference_price_msg = haskell_res[rs_idx]
-        assert reference_price_msg[0] == "ReferencePrice", "line " + str(
-            rs_idx + request_count + 2) + " ReferencePrice should be declared after OrderRq but " + reference_price_msg[
-                                                               0]
-        rs_idx += 1
-
-        static_price_band_lower_limit_msg = haskell_res[rs_idx]
-        assert static_price_band_lower_limit_msg[0] == "StaticPriceBandLowerLimit", "line " + str(
-            rs_idx + request_count + 2) + " StaticPriceBandLowerLimit should be declared after OrderRq but " + \
-                                                                                    reference_price_msg[0]
-        rs_idx += 1
-
-        static_price_band_upper_limit_msg = haskell_res[rs_idx]
-        assert static_price_band_upper_limit_msg[0] == "StaticPriceBandUpperLimit", "line " + str(
-            rs_idx + request_count + 2) + " StaticPriceBandUpperLimit should be declared after OrderRq but " + \
-                                                                                    reference_price_msg[0]
-        rs_idx += 1
-
-        total_shares_msg = haskell_res[rs_idx]
-        assert total_shares_msg[0] == "TotalShares", "line " + str(
-            rs_idx + request_count + 2) + " TotalShares should be declared after OrderRq but " + reference_price_msg[0]
-        rs_idx += 1
-
-        ownership_upper_limit_msg = haskell_res[rs_idx]
-        assert ownership_upper_limit_msg[0] == "OwnershipUpperLimit", "line " + str(
-            rs_idx + request_count + 2) + " OwnershipUpperLimit should be declared after OrderRq but " + \
-                                                                      reference_price_msg[0]
-        rs_idx += 1
-
-        tick_size_msg = haskell_res[rs_idx]
-        assert tick_size_msg[0] == "TickSize", "line " + str(
-            rs_idx + request_count + 2) + " TickSize should be declared after OrderRq but " + reference_price_msg[0]
-        rs_idx += 1
-
-        lot_size_msg = haskell_res[rs_idx]
-        assert lot_size_msg[0] == "LotSize", "line " + str(
-            rs_idx + request_count + 2) + " LotSize should be declared after OrderRq but " + reference_price_msg[0]
-        rs_idx += 1
-
-        return rs_idx, orderbook
-
-    def _read_trades(self, haskell_res: List[List[object]], rs_idx: int, request_count: int):
-        trades_count_msg = haskell_res[rs_idx]
-        rs_idx += 1
-        assert trades_count_msg[0] == "Trades", "line " + str(
-            rs_idx + request_count + 2) + " Trades count should be declared after OrderRq but " + trades_count_msg[0]
-        trades_count = trades_count_msg[1]
-        trades = haskell_res[rs_idx: rs_idx + trades_count]
-        trades = list(map(lambda trade: Trade(*trade[1:]), trades))
-        rs_idx += trades_count
-
-        return rs_idx, trades
-
-    def translate(self, request_count: int, haskell: List[List[object]]) -> Tuple[List[str], List[str]]:
-        haskell_req = haskell[:request_count]
-        haskell_res = haskell[request_count:]
-        translated_feed = []
-        translated_result = []
-        rs_idx = 0
-
-        translated_feed.append(json.dumps({"command": "Change System State", "targetState": "TRADING_SESSION"}))
-        translated_feed.append(json.dumps({"timestamp": "08:30:00.000000000"}))
-        for i in range(request_count):
-            rq = haskell_req[i]
-            rs = haskell_res[rs_idx]
-            rs_idx += 1
+    @staticmethod
+    def _read_declaration(responses: Iterator[Tuple[int, List[object]]], name: str, what: str) -> Tuple[int, int]:
+        line, msg = next(responses, (None, None))
+        assert msg is not None, "unexpected end of haskell output, %s should be declared after OrderRq" % name
+        assert msg[0] == name, "line %d %s should be declared after OrderRq but %s" % (line, what, msg[0])
+        return line, msg[1]
+
+    @classmethod
+    def _read_count(cls, responses: Iterator[Tuple[int, List[object]]], name: str, what: str) -> int:
+        return cls._read_declaration(responses, name, what)[1]
+
+    def _read_state(self, responses: Iterator[Tuple[int, List[object]]], snapshot: bool = True) -> \
+            Optional[Tuple[int, Dict[str, int]]]:
+        """read the security state following an order response, returning the line of its order book & the remaining
+        qty of the queued orders; without `snapshot`, the queued orders are skipped and None is returned"""
+        line, orderbook_count = self._read_declaration(responses, "Orders", "OrderBooks length")
+        orderbook = None
+        if snapshot:
+            # queued orders are reported as (tag, order_type, id, broker, shareholder, price, qty, ...)
+            orderbook = line, {order[2]: order[6] for _, order in islice(responses, orderbook_count)}
+        else:
+            for _ in islice(responses, orderbook_count):
+                pass
+
+        credits_count = self._read_count(responses, "Credits", "Credits count")
+        for _ in islice(responses, credits_count):
+            pass
+
+        ownerships_count = self._read_count(responses, "Ownerships", "Ownerships count")
+        for _ in islice(responses, ownerships_count):
+            pass
+
+        for name in STATE_MSGS:
+            self._read_count(responses, name, name)
+
+        return orderbook
+
+    def _read_trades(self, responses: Iterator[Tuple[int, List[object]]]) -> List[Trade]:
+        trades_count = self._read_count(responses, "Trades", "Trades count")
+        return [Trade(*trade[1:]) for _, trade in islice(responses, trades_count)]
+
+    def translate_requests(self, request_count: int, requests: Iterable[List[object]],
+                           responses: Iterable[List[object]], start: int = 0, response_offset: int = 0) -> \
+            Iterator[Tuple[List[str], List[str]]]:
+        """lazily translate each request, with its response group, into its (feed, result) lines
+
+        `requests` and `responses` are the parsed request and response sections of the haskell output; they are
+        consumed one request/response group at a time. When resuming from a checkpoint, they start at request `start`
+        and at the `response_offset`-th record of the response section, so that line numbers stay right.
+        With `compact_feed`, a price band setter directly followed by another one only updates the security state, so
+        that a run of setters is translated into a single price band cycle, with the final band & reference price.
+        """
+        requests = enumerate(requests, 2 + start)
+        responses = enumerate(responses, request_count + 2 + response_offset)
+        next_rq = next(requests, (None, None))
+        for _ in range(start, request_count):
+            rq_line, rq = next_rq
+            next_rq = next(requests, (None, None)) if rq is not None else (None, None)
+            rs_line, rs = next(responses, (None, None))
+            assert rq is not None, "missing request, %d declared" % request_count
+            assert rs is not None, "missing response to line %d request %s" % (rq_line, rq[0])
             # print(rq)
             # print(rs)
-            assert rq[0].endswith("Rq"), "line " + str(i + 2) + " request should be ended with 'Rq' " + rq[0]
-            assert rs[0].endswith("Rs"), "line " + str(
-                rs_idx + request_count + 2) + " response should be ended with 'Rs' " + rq[0]
+            assert rq[0].endswith("Rq"), "line " + str(rq_line) + " request should be ended with 'Rq' " + rq[0]
+            assert rs[0].endswith("Rs"), "line " + str(rs_line) + " response should be ended with 'Rs' " + rq[0]
             assert rq[0][0:-2] == rs[0][0:-2], "line " + str(
-                rs_idx + request_count + 2) + " response should match request: %s, %s" % (rq[0], rs[0])
+                rs_line) + " response should match request: %s, %s" % (rq[0], rs[0])
 
             if rq[0].startswith("Set"):
                 assert rs[1] == "Accepted", "unsuccessful admin command " + rq[0]
 
-                feed, result = self.translate_admin_cmd(rq)
-                translated_feed += feed
-                translated_result += result
+                feed, results = self.translate_admin_cmd(rq)
+                if self.compact_feed and rq[0] in PRICE_BAND_RQS and next_rq[1] is not None and \
+                        next_rq[1][0] in PRICE_BAND_RQS:
+                    feed = []
+                yield feed, results
 
             else:
+                self.order_requests += 1
+                check = self.check_every and self.order_requests % self.check_every == 0
                 if rq[0] in {"NewOrderRq", "ReplaceOrderRq"}:
                     order_rq = OrderRq(*rq)
-                    rs_idx, trades = self._read_trades(haskell_res, rs_idx, request_count)
-                    rs_idx, orderbook = self._read_state(haskell_res, rs_idx, request_count)
-                    feed, results = self.translate_incoming_order_cmd(order_rq, rs, trades, orderbook)
-                    translated_feed.append(feed)
-                    translated_result += results
+                    trades = self._read_trades(responses)
+                    orderbook = self._read_state(responses, check)
+                    feed, results = self.translate_incoming_order_cmd(order_rq, rs, trades)
+                    ids = chain([order_rq.id, order_rq.old_id], *((trade.buy_id, trade.sell_id) for trade in trades))
                 elif rq[0] == "CancelOrderRq":
                     order_rq = OrderRq(*rq, None, None, None)
-                    rs_idx, orderbook = self._read_state(haskell_res, rs_idx, request_count)
-                    feed, result = self.translate_cancel_order_cmd(order_rq, rs, orderbook)
-                    translated_feed.append(feed)
-                    translated_result.append(result)
+                    orderbook = self._read_state(responses, check)
+                    feed, result = self.translate_cancel_order_cmd(order_rq, rs)
+                    results = [result]
+                    ids = [order_rq.id, order_rq.old_id]
                 else:
                     raise RuntimeError("Invalid request type '%s'" % rq[0])
+                if orderbook is not None:
+                    self.check_order_book_view(*orderbook)
+                if self.bounded_memory:
+                    self.evict_terminal_orders(ids)
+                yield [feed], results
+
+    def checkpoint(self) -> Dict[str, object]:
+        """state the translation of the next requests depends on, besides the configuration"""
+        return {name: getattr(self, name) for name in CHECKPOINT_STATE}
+
+    def restore(self, state: Dict[str, object]) -> None:
+        """resume from the state of a checkpoint"""
+        for name in CHECKPOINT_STATE:
+            setattr(self, name, state[name])
+        self.previous_remaining_qty = {}
+
+    def fork(self) -> "Translator":
+        """copy of the translator, to translate diverging continuations of the requests translated so far
+
+        Only the containers of the state are copied: the orders they hold are never mutated once stored, so they are
+        shared with the copy.
+        """
+        res = copy(self)
+        for name in CHECKPOINT_STATE:
+            value = getattr(self, name)
+            if not isinstance(value, (int, float)):
+                setattr(res, name, value.copy())
+        res.previous_remaining_qty = {}
+        return res
+
+    def translate_iter(self, request_count: int, records: Iterable[List[object]],
+                       responses: Iterable[List[object]] = None) -> Iterator[Tuple[str, str]]:
+        """stream the translation as (channel, line) pairs, channel being FEED or ORACLE
+
+        Without `responses`, `records` is the whole parsed haskell output and only its request section is buffered.
+        Given an independent iterator over the response section (e.g. a second reader of the same file), nothing is
+        buffered and memory only depends on the order book depth.
+        """
+        if responses is None:
+            records = iter(records)
+            requests = list(islice(records, request_count))
+            responses = records
+        else:
+            requests = records
+
+        yield from translation_lines(self.translate_requests(request_count, requests, responses))
+
+    def translate(self, request_count: int, haskell: List[List[object]]) -> Tuple[List[str], List[str]]:
+        translated_feed = []
+        translated_result = []
+
+        translated_feed.append(json.dumps({"command": "Change System State", "targetState": "TRADING_SESSION"}))
+        translated_feed.append(json.dumps({"timestamp": "08:30:00.000000000"}))
+        for feed, results in self.translate_requests(
+                request_count, islice(haskell, request_count), islice(haskell, request_count, None)):
+            translated_feed += feed
+            translated_result += results
 
         # translated_feed.append(json.dumps({"command": "End Session"}))
         translated_feed.append(json.dumps({"command": "Shutdown"}))
@@ -336,221 +562,132 @@ class Translator:
         return self.get_price_band_cmds(), [""]
 
     def get_price_band_cmds(self) -> [str]:
+        """price band cycle of the security: SURVEILLANCE, static price band change, RESERVED & OPENED
+
+        The commands are rendered from pre-serialized templates, byte for byte what json.dumps gives.
+        """
         return [
-            json.dumps({
-                "command": "Change Security State",
-                "items": [self.security_id],
-                "groupName": None,
-                "targetState": "SURVEILLANCE"
-            }),
-            json.dumps({
-                "command": "Change Security Static Price Band",
-                "items": [self.security_id],
-                "priceBandPercentage":
-                    {"upperBound": self.upper_bound_percentage * 100,
-                     "lowerBound": self.lower_bound_percentage * 100},
-                "referencePrice": self.reference_price,
-                "groupCode": None
-            }),
-            json.dumps({
-                "command": "Change Security State",
-                "items": [self.security_id],
-                "groupName": None,
-                "targetState": "RESERVED"
-            }),
-            json.dumps({
-                "command": "Change Security State",
-                "items": [self.security_id],
-                "groupName": None,
-                "targetState": "OPENED"
-            }),
+            self._surveillance_cmd,
+            self._price_band_format % (
+                _json_number(self.upper_bound_percentage * 100),
+                _json_number(self.lower_bound_percentage * 100),
+                _json_number(self.reference_price),
+            ),
+            self._reserved_cmd,
+            self._opened_cmd,
         ]
 
     def translate_ownership_cmd(self, rq: List[object]) -> Tuple[List[str], List[str]]:
         """translate "Set Ownership" Admin Command to set ownership of shareholders"""
-        return ["SET PO shareholder=%s shares=%s" % tuple(rq[1:])], [""]
+        return ["SET PO %sshareholder=%s shares=%s" % ((self._admin_scope,) + tuple(rq[1:]))], [""]
 
     def translate_credit_cmd(self, rq: List[object]) -> Tuple[List[str], List[str]]:
         """translate "Set Credit" Admin Command to set credit of brokers"""
-        return ["SET CM broker=%s credit=%s" % tuple(rq[1:])], [""]
+        return ["SET CM %sbroker=%s credit=%s" % ((self._admin_scope,) + tuple(rq[1:]))], [""]
 
     def translate_tick_size_cmd(self, rq: List[object]) -> Tuple[List[str], List[str]]:
         """translate "Set Tick" Admin Command to set security price tick size"""
-        return ["SET SECURITY tick=%s" % tuple(rq[1:])], [""]
+        return ["SET SECURITY %stick=%s" % ((self._admin_scope,) + tuple(rq[1:]))], [""]
 
     def translate_lot_size_cmd(self, rq: List[object]) -> Tuple[List[str], List[str]]:
         """translate "Set Lot" Admin Command to set security quantity lot size"""
-        return ["SET SECURITY lot=%s" % tuple(rq[1:])], [""]
+        return ["SET SECURITY %slot=%s" % ((self._admin_scope,) + tuple(rq[1:]))], [""]
 
     def translate_ownership_upper_limit_cmd(self, rq: List[object]) -> Tuple[List[str], List[str]]:
         """translate "Set OwnershipUpperLimit" Admin Command to set security max allowed percentage of ownership"""
-        return ["SET SECURITY ownershipUpperLimit=%s" % tuple(rq[1:])], [""]
+        return ["SET SECURITY %sownershipUpperLimit=%s" % ((self._admin_scope,) + tuple(rq[1:]))], [""]
 
     def translate_total_shares_cmd(self, rq: List[object]) -> Tuple[List[str], List[str]]:
         """translate "Set TotalShares" Admin Command to set security total number of shares"""
-        return ["SET SECURITY totalShares=%s" % tuple(rq[1:])], [""]
+        return ["SET SECURITY %stotalShares=%s" % ((self._admin_scope,) + tuple(rq[1:]))], [""]
 
     def translate_order(self, rq: OrderRq) -> str:
         """translate SLE-0001 & SLE-0002"""
-        return "".join([
-            ("%d=" % rq.id).ljust(16),
-            {"NewOrderRq": "0001", "ReplaceOrderRq": "0002"}.get(rq.order_request_type, "0000"),
-            self.date,  # original order date
-            "%06d" % self.sequence_nums.get(rq.old_id, 0),  # original HON
-            str(self.security_id).ljust(12),
-            {"BUY": "A", "SELL": "V", "CROSS": "2"}.get(rq.side, " "),  # side
-            "%012d" % rq.qty,  # qty
-            {"Limit": "L", "Iceberg": "L"}.get(rq.order_type, " "),  # type
-            self.translate_price_to_mmtp(rq.price),  # price
-            {True: "E", False: "J"}.get(rq.fak, " "),  # validity type
-            "%08d" % 0,  # validity date
-            "%012d" % rq.min_qty,  # min qty
-            "%012d" % (rq.disclodes_qty if rq.order_type == "Iceberg" else 0),  # disclosed qty
-            str(rq.broker).ljust(8),  # broker
-            "A",  # technical origin
-            "0",  # confirmation flag
-            "0",  # preopening flag
-            " %09d" % 0,  # trigger price
-            "%6s" % "",
-            "%012d" % self.remaining_qty.get(rq.old_id, 0),  # expected remaining qty
-            " 189980021",
-            str(rq.shareholder).ljust(16),  # shareholder
-            "1       ",
-            self.date,
-            self.time,
-            "189-IR98001",
-            "%26s" % "",
-        ])
+        return self._order_formats.get(rq.order_request_type, self._order_formats[None]) % (
+            "%d=" % rq.id,
+            self._hon(rq.old_id),  # original HON
+            SIDES.get(rq.side, " "),  # side
+            rq.qty,  # qty
+            ORDER_TYPES.get(rq.order_type, " "),  # type
+            int(rq.price),  # price
+            VALIDITY_TYPES.get(rq.fak, " "),  # validity type
+            rq.min_qty,  # min qty
+            rq.disclodes_qty if rq.order_type == "Iceberg" else 0,  # disclosed qty
+            rq.broker,  # broker
+            self.remaining_qty.get(rq.old_id, 0),  # expected remaining qty
+            rq.shareholder,  # shareholder
+        )
 
     def translate_cancel_order(self, rq: OrderRq) -> str:
         """translate SLE-0003"""
-        return "".join([
-            ("%d=" % rq.id).ljust(16),
-            {"CancelOrderRq": "0003"}.get(rq.order_request_type, "0000"),
-            self.date,  # original order date
-            "%06d" % self.sequence_nums.get(rq.old_id, 0),  # original HON
-            str(rq.broker if rq.broker else "").ljust(8),  # broker
-            str(self.security_id).ljust(12),
-            {"BUY": "A", "SELL": "V", "CROSS": "2"}.get(rq.side, " "),  # side
-        ])
+        return self._cancel_formats.get(rq.order_request_type, self._cancel_formats[None]) % (
+            "%d=" % rq.id,
+            self._hon(rq.old_id),  # original HON
+            rq.broker if rq.broker else "",  # broker
+            SIDES.get(rq.side, " "),  # side
+        )
 
     def translate_rejection_msg(self, rq: OrderRq) -> str:
         """translate SLE-0144"""
-        return "".join([
-            ("%d=" % rq.id).ljust(16),
-            "0144",
-            {"NewOrderRq": "0001", "ReplaceOrderRq": "0002", "CancelOrderRq": "0003"}.get(rq.order_request_type,
-                                                                                          "0000"),
-            "%06d" % 0,
-            "".ljust(71),
-        ])
+        return self._rejection_format % (
+            "%d=" % rq.id,
+            FUNCTION_CODES.get(rq.order_request_type, "0000"),
+        )
 
     def translate_confirmation_msg(self, rq: OrderRq, traded_qty_on_entry: int = 0) -> str:
         """translate SLE-0172"""
         if rq.order_request_type == "CancelOrderRq":
             order_status = "A"
-        elif self.eliminated[rq.id]:
+            qty = self.previous_remaining_qty.get(rq.old_id, 0)
+        elif rq.id in self.eliminated:
             order_status = "E"
-        elif self.remaining_qty[rq.id] == 0:
+        elif self.remaining_qty.get(rq.id, 0) == 0:
             order_status = "X"
         else:
             order_status = " "
 
-        return "".join([
-            ("%d=" % rq.id).ljust(16),
-            "0172",
-            self.date,
-            "%06d" % self.sequence_nums[rq.id],  # HON
+        if rq.order_request_type == "ReplaceOrderRq":
+            original_hon = self._hon(rq.old_id)
+            original_remaining_qty = self.previous_remaining_qty.get(rq.old_id, 0)
+        else:
+            original_hon = 0
+            original_remaining_qty = 0
+        if rq.order_request_type in {"NewOrderRq", "ReplaceOrderRq"}:
+            qty = rq.qty
+        elif rq.order_request_type != "CancelOrderRq":
+            qty = 0
+
+        return self._confirmation_formats.get(rq.order_request_type, self._confirmation_formats[None]) % (
+            "%d=" % rq.id,
+            self.sequence_nums[rq.id],  # HON
             order_status,  # status
-            str(self.security_id).ljust(12),
-            {
-                "NewOrderRq": "%012d" % rq.qty,
-                "ReplaceOrderRq": "%012d" % rq.qty,
-                "CancelOrderRq": "%012d" % self.previous_remaining_qty[rq.old_id],
-            }.get(rq.order_request_type, "%012d" % 0),  # qty
-            # "%012d" % rq.qty,  # qty
-            {"BUY": "A", "SELL": "V", "CROSS": "2"}.get(rq.side, " "),  # side
-            self.translate_price_to_mmtp(rq.price),  # price
-            str(rq.broker).ljust(8),  # broker
-            "%06d" % 0,
-            self.time,
-            {"Limit": "L", "Iceberg": "L"}.get(rq.order_type, " "),  # type
-            "%012d" % traded_qty_on_entry,  # matched qty at entry
-            {
-                "NewOrderRq": "0001",
-                "ReplaceOrderRq": "0002",
-                "CancelOrderRq": "0003",
-            }.get(rq.order_request_type, "0000"),  # original function code
-            {
-                "NewOrderRq": "%08d" % 0,
-                "ReplaceOrderRq": self.date,
-                "CancelOrderRq": "%08d" % 0,
-            }.get(rq.order_request_type, "%08d" % 0),  # original order date
-            {
-                "NewOrderRq": "%06d" % 0,
-                "ReplaceOrderRq": "%06d" % self.sequence_nums.get(rq.old_id, 0),
-                "CancelOrderRq": "%06d" % 0,
-            }.get(rq.order_request_type, "%06d" % 0),  # original HON
-            {True: "E", False: "J"}.get(rq.fak, " "),  # validity type
-            {
-                "NewOrderRq": "%08d" % 0,
-                "ReplaceOrderRq": "%08d" % 0,
-                "CancelOrderRq": self.date,
-            }.get(rq.order_request_type, "%08d" % 0),  # validity date
-            "%012d" % rq.min_qty,  # min qty
-            "%012d" % (rq.disclodes_qty if rq.order_type == "Iceberg" else 0),  # disclosed qty
-            "A",  # technical origin
-            "0",  # confirmation flag
-            "%012d" % {
-                "NewOrderRq": 0,
-                "ReplaceOrderRq": self.previous_remaining_qty.get(rq.old_id, 0),
-                "CancelOrderRq": 0,
-            }.get(rq.order_request_type, 0),  # original remaining qty
-            " %09d" % 0,  # trigger price
-            "%06d" % 0,
-            " 189980021",
-            str(rq.shareholder).ljust(16),  # shareholder
-            "1       ",
-            self.date,
-            self.time,
-            "189-IR98001",
-            "                          ",
-            ("%s%s" % (self.date, self.time)).ljust(20, "0"),
-        ])
+            qty,  # qty
+            SIDES.get(rq.side, " "),  # side
+            int(rq.price),  # price
+            rq.broker,  # broker
+            ORDER_TYPES.get(rq.order_type, " "),  # type
+            traded_qty_on_entry,  # matched qty at entry
+            original_hon,  # original HON
+            VALIDITY_TYPES.get(rq.fak, " "),  # validity type
+            rq.min_qty,  # min qty
+            rq.disclodes_qty if rq.order_type == "Iceberg" else 0,  # disclosed qty
+            original_remaining_qty,  # original remaining qty
+            rq.shareholder,  # shareholder
+        )
 
     def translate_execution_notice(self, trade: Trade, rq: OrderRq) -> str:
         """translate SLE-0105"""
-        return "".join([
-            ("%d=" % rq.id).ljust(16),
-            "0105",
-            self.date,
-            "%06d" % self.sequence_nums[rq.id],  # HON
-            str(self.security_id).ljust(12),
-            str(self.group).ljust(2),
-            {"BUY": "A", "SELL": "V", "CROSS": "2"}.get(rq.side, " "),  # side
-            "%012d" % trade.qty,
-            self.translate_price_to_mmtp(trade.price),  # price
-            ["0", "1"][self.remaining_qty[rq.id] > 0],  # remaining qty flag
-            "%012d" % self.remaining_qty[rq.id],  # remaining qty
-            "%8s" % "",  # counterpart broker
-            "1",  # counterpart origin
-            "A",  # technical origin
-            "%06d" % 0,
-            self.date,
-            self.time,
-            "%07d" % self.trade_cnt,  # trade number
-            self.date,
-            {"Limit": "L", "Iceberg": "L"}.get(rq.order_type, " "),  # type
-            {True: "E", False: "J"}.get(rq.fak, " "),  # validity type
-            "A",  # Code of the instrument category
-            "%9s" % "",
-            "189980021",
-            str(rq.shareholder).ljust(16),  # shareholder
-            "1       ",
-            self.date,
-            self.time,
-            "189-IR98001",
-            ("%s%s" % (self.date, self.time)).ljust(20, "0"),
-            "%6s" % "",
-            "00",
-        ])
+        remaining_qty = self.remaining_qty[rq.id]
+        return self._execution_notice_format % (
+            "%d=" % rq.id,
+            self.sequence_nums[rq.id],  # HON
+            SIDES.get(rq.side, " "),  # side
+            trade.qty,
+            int(trade.price),  # price
+            "1" if remaining_qty > 0 else "0",  # remaining qty flag
+            remaining_qty,  # remaining qty
+            self.trade_cnt,  # trade number
+            ORDER_TYPES.get(rq.order_type, " "),  # type
+            VALIDITY_TYPES.get(rq.fak, " "),  # validity type
+            rq.shareholder,  # shareholder
+        )
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+
+import json
+from argparse import ArgumentParser
+from os import environ, getcwd, getuid, path
+from socket import AF_UNIX, SHUT_WR, SOCK_STREAM, socket
+from sys import argv, stderr, stdout
+from tempfile import gettempdir
+from typing import Dict, List, Tuple
+
+# only the standard library is imported here: the client must start faster than a haskell2mmtp.py run
+DEFAULT_SOCKET = path.join(gettempdir(), "haskell2mmtp-%d.sock" % getuid())
+# exit status of a daemon whose translator sources changed since it started
+STALE = 75
+
+
+def socket_path() -> str:
+    return environ.get("HASKELL2MMTP_SOCKET", DEFAULT_SOCKET)
+
+
+def request(msg: Dict[str, object], sock_path: str = None) -> Dict[str, object]:
+    """send a request to the translator daemon & return its response: one connection per request, the request is
+    sent & the write side shut down, then the response is read until the daemon closes the connection"""
+    with socket(AF_UNIX, SOCK_STREAM) as sock:
+        sock.connect(sock_path or socket_path())
+        sock.sendall(json.dumps(msg).encode())
+        sock.shutdown(SHUT_WR)
+        return json.loads(b"".join(iter(lambda: sock.recv(1 << 16), b"")))
+
+
+def translate(test_case: List[str], options: Dict[str, object] = None, sock_path: str = None) -> Tuple[str, str]:
+    """translate the stripped lines of a raw test case with the daemon, returning its feed & oracle MMTP contents"""
+    res = request({"op": "translate", "test_case": test_case, "options": options or {}}, sock_path)
+    assert "error" not in res, res.get("error")
+    return res["feed"], res["oracle"]
+
+
+def main():
+    # every other argument is haskell2mmtp.py's, --help included
+    parser = ArgumentParser(usage="\t%(prog)s [--socket PATH] <haskell2mmtp.py arguments>", add_help=False,
+                            allow_abbrev=False)
+    parser.add_argument("--socket", default=socket_path())
+    options, args = parser.parse_known_args(argv[1:])
+    sock_path = options.socket
+    try:
+        res = request({"op": "run", "argv": args, "cwd": getcwd()}, sock_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        res = {"status": STALE}
+    if res["status"] == STALE:
+        # no daemon (or a stale one): convert in this process
+        from haskell2mmtp import main as haskell2mmtp
+        haskell2mmtp(args)
+        return
+    stdout.write(res["stdout"])
+    stderr.write(res["stderr"])
+    exit(res["status"])
+
+
+if __name__ == '__main__':
+    main()
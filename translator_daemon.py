@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+
+import json
+import sys
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from hashlib import sha256
+from io import StringIO
+from os import chdir, close, dup, dup2, getcwd, path, remove, stat
+from socket import AF_UNIX, SOCK_STREAM, socket
+from socketserver import StreamRequestHandler, UnixStreamServer
+from sys import stderr, stdout
+from tempfile import TemporaryFile
+from traceback import format_exc
+from typing import Dict, Iterator, List, Tuple
+
+from haskell2mmtp import format_error, main as haskell2mmtp, parse_lines, skipped_blocks, write_channels
+from translator import Translator
+from translator_client import STALE, request, socket_path
+
+
+@contextmanager
+def captured_output() -> Iterator[List[str]]:
+    """capture what is written on the standard output & error file descriptors, those of the pool workers
+    included, into the [stdout, stderr] list once the block exits
+
+    The descriptors of the whole process are swapped, so that forked workers inherit them: only one block may be
+    active at a time.
+    """
+    res = []
+    with TemporaryFile() as out, TemporaryFile() as err:
+        stdout.flush()
+        stderr.flush()
+        saved = [dup(1), dup(2)]
+        dup2(out.fileno(), 1)
+        dup2(err.fileno(), 2)
+        try:
+            yield res
+        finally:
+            stdout.flush()
+            stderr.flush()
+            dup2(saved[0], 1)
+            dup2(saved[1], 2)
+            for fd in saved:
+                close(fd)
+            for f in (out, err):
+                f.seek(0)
+                res.append(f.read().decode(errors="replace"))
+
+
+def run(args: List[str], cwd: str) -> Dict[str, object]:
+    """run haskell2mmtp.py with these arguments from the client working directory
+
+    The working directory & standard descriptors of the whole daemon are switched for the run, which is why requests
+    are served strictly one at a time.
+    """
+    status = 0
+    saved_cwd = getcwd()
+    with captured_output() as output:
+        try:
+            chdir(cwd)
+            haskell2mmtp(args, prog="haskell2mmtp.py")
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 0 if e.code is None else 1
+            if isinstance(e.code, str):
+                print(e.code, file=stderr)
+        except Exception:
+            status = 1
+            print(format_exc(), end="", file=stderr)
+        finally:
+            chdir(saved_cwd)
+    return {"status": status, "stdout": output[0], "stderr": output[1]}
+
+
+def translate(test_case: List[str], options: Dict[str, object]) -> Dict[str, object]:
+    """translate a raw test case with a fresh Translator, returning its feed & oracle MMTP contents"""
+    feed, oracle = StringIO(), StringIO()
+    try:
+        records = parse_lines(test_case[1:], skip_unused=True, skip_blocks=skipped_blocks(options))
+        write_channels(Translator(**options).translate_iter(int(test_case[0]), records), feed, oracle)
+    except Exception as e:
+        return {"error": format_error(e)}
+    return {"feed": feed.getvalue(), "oracle": oracle.getvalue()}
+
+
+class LoadedSources:
+    """Digests of the sources of the modules of this directory loaded by the daemon
+
+    Every source is hashed once, when its module is first seen loaded, then only hashed again when its size or
+    modification time changes, so that checking for changes costs a stat per module.
+    """
+    root: str
+    _sources: Dict[str, Tuple[Tuple[int, int], str]]
+
+    def __init__(self):
+        self.root = path.dirname(path.abspath(__file__))
+        self._sources = {}
+        self.changed()
+
+    def _loaded(self) -> List[str]:
+        paths = (getattr(module, "__file__", None) for module in list(sys.modules.values()))
+        return [
+            source for source in map(path.abspath, filter(None, paths))
+            if path.dirname(source) == self.root and source.endswith(".py")
+        ]
+
+    def changed(self) -> bool:
+        """whether the source of a loaded module changed since it was first seen"""
+        res = False
+        for source in self._loaded():
+            try:
+                st = stat(source)
+            except FileNotFoundError:
+                return True
+            known = self._sources.get(source)
+            if known is not None and known[0] == (st.st_mtime_ns, st.st_size):
+                continue
+            with open(source, "rb") as f:
+                digest = sha256(f.read()).hexdigest()
+            if known is not None and known[1] != digest:
+                res = True
+            self._sources[source] = ((st.st_mtime_ns, st.st_size), digest)
+        return res
+
+
+class TranslatorDaemon(UnixStreamServer):
+    """Long-running translator serving haskell2mmtp.py conversions over a unix socket
+
+    Requests are served strictly one at a time (runs switch the process working directory & standard descriptors),
+    each with fresh Translators, so the interpreter startup, imports & layout compilation are only paid once. The
+    daemon stops serving once the source of any module it loaded changes, so that a warm daemon never translates with
+    outdated code: clients then fall back on an in-process conversion.
+    """
+    sources: LoadedSources
+    running: bool
+
+    def __init__(self, sock_path: str):
+        if path.exists(sock_path):
+            with socket(AF_UNIX, SOCK_STREAM) as sock:
+                assert sock.connect_ex(sock_path), "a translator daemon is already listening on %s" % sock_path
+            remove(sock_path)
+        super().__init__(sock_path, TranslatorHandler)
+        self.sources = LoadedSources()
+        self.running = True
+
+    def respond(self, msg: Dict[str, object]) -> Dict[str, object]:
+        if self.sources.changed():
+            self.running = False
+            return {"status": STALE, "error": "translator sources changed, the daemon stopped"}
+        try:
+            if msg["op"] == "run":
+                return run(msg["argv"], msg["cwd"])
+            if msg["op"] == "translate":
+                return translate(msg["test_case"], msg["options"])
+            if msg["op"] == "shutdown":
+                self.running = False
+                return {"status": 0}
+            return {"status": 2, "error": "unknown request %s" % msg["op"]}
+        finally:
+            # modules a request imported lazily are tracked from now on
+            self.sources.changed()
+
+    def serve(self) -> None:
+        try:
+            while self.running:
+                self.handle_request()
+        finally:
+            self.server_close()
+            remove(self.server_address)
+
+
+class TranslatorHandler(StreamRequestHandler):
+    server: TranslatorDaemon
+
+    def handle(self) -> None:
+        res = self.server.respond(json.loads(self.rfile.read()))
+        self.wfile.write(json.dumps(res).encode())
+
+
+def main():
+    parser = ArgumentParser(
+        usage="\t%(prog)s [--socket PATH]\n\t%(prog)s --stop [--socket PATH]",
+        description="serve haskell2mmtp.py conversions to translator_client.py from a warm process")
+    parser.add_argument("--socket", default=socket_path(),
+                        help="unix socket to listen on (default: $HASKELL2MMTP_SOCKET or %(default)s)")
+    parser.add_argument("--stop", action="store_true", help="stop the daemon listening on the socket")
+    args = parser.parse_args()
+
+    if args.stop:
+        request({"op": "shutdown"}, args.socket)
+        return
+    TranslatorDaemon(args.socket).serve()
+
+
+if __name__ == '__main__':
+    main()